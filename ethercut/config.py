@@ -21,15 +21,41 @@ Ethercut configuration:
 
 snaplen:  Snapshot len for sniffing pcap stream
 sniff_timeout : Pcap timeout in sniffing thread
+auto_filter: Generate a kernel filter from the TARGETs (1) or capture every packet (0)
+capture_backend: Live capture through pcap or a TPACKET_V3 ring (tpacket, Linux only)
+ring_block_size, ring_blocks: Size in bytes and number of the blocks of the capture ring
+ring_timeout: Milliseconds after which the kernel hands over a block that isn't full
 spoofermodules: Spoofer modules to be registered
 decodermodules: Decoder modules to be registered
 geoip_database: Path to Maxmind's database
+geoip_cache_size: Number of IP addresses whose location is remembered
+geoip_workers: Number of threads looking up locations in the database
+flow_table_size: Maximum number of flows tracked by the koala filter
+flow_timeout: Seconds without packets before a flow is forgotten
+sniff_queue_size, forward_queue_size, decode_queue_size, inject_queue_size: Capacity of the
+    packet queues (0 for unbounded)
+sniff_queue_policy, forward_queue_policy, decode_queue_policy, inject_queue_policy: What to do
+    when a queue is full (block, drop-newest, drop-oldest or shed)
+forward_mode: Koala filter forwarding, rewriting the ethernet header (l2) or routing (l3)
+workers: Number of koala filter processes, the packets are sharded among them by flow
+shard_ring_size: Bytes of the shared memory ring that carries the packets to every worker
+inject_workers: Number of packet injection threads
+inject_rate: Maximum packets per second injected by all the workers (0 for no limit)
+inject_batch: Maximum packets sent by a worker on every wake-up
+ui_refresh: Times per second the user interface prints the queued messages
+ui_max_lines: Maximum lines printed on every refresh, the rest are suppressed
+control_socket: Path of the UNIX socket that serves the metrics and state (empty to disable)
     """
      # Parsed from configuration file
     __parsers = reglist.RegList()
     # SNIFFER
     snaplen = 65535
     sniff_timeout = 1
+    auto_filter = 1
+    capture_backend = "pcap"
+    ring_block_size = 1 << 20
+    ring_blocks = 64
+    ring_timeout = 64
     # SPOOFERS
     spoofermodules = []
     # DECODERS
@@ -37,9 +63,31 @@ geoip_database: Path to Maxmind's database
     decoderports = []
     # GEOIP
     geoip_database = ""
+    geoip_cache_size = 4096
+    geoip_workers = 2
+    # KOALA FILTER
+    flow_table_size = 65536
+    flow_timeout = 60
+    forward_mode = "l2"
+    workers = 1
+    shard_ring_size = 16 << 20
+    sniff_queue_size = 65536
+    sniff_queue_policy = "shed"
+    forward_queue_size = 65536
+    forward_queue_policy = "block"
+    decode_queue_size = 16384
+    decode_queue_policy = "drop-newest"
     # Packet injector
     inject_workers = 4
-    inject_timeout = 0.0
+    inject_rate = 0
+    inject_batch = 64
+    inject_queue_size = 65536
+    inject_queue_policy = "block"
+    # User interface
+    ui_refresh = 10.0
+    ui_max_lines = 100
+    # Control socket
+    control_socket = ""
 
     # Configured at runtime
     spooferlist = reglist.RegList()
@@ -109,6 +157,41 @@ geoip_database: Path to Maxmind's database
         field, value = map(lambda x: x.strip(), entry.split("="))
         self.__setattr__(field, type(self.__getattribute__(field))(value))
 
+    @__parsers.register
+    def koala(self, entry):
+        """
+        Collect data for the koala filter
+        """
+        field, value = map(lambda x: x.strip(), entry.split("="))
+        self.__setattr__(field, type(self.__getattribute__(field))(value))
+
+    @__parsers.register
+    def injector(self, entry):
+        """
+        Collect data for the packet injector
+        """
+        field, value = map(lambda x: x.strip(), entry.split("="))
+        self.__setattr__(field, type(self.__getattribute__(field))(value))
+
+    @__parsers.register
+    def ui(self, entry):
+        """
+        Collect data for the user interface
+        """
+        field, value = map(lambda x: x.strip(), entry.split("="))
+        self.__setattr__(field, type(self.__getattribute__(field))(value))
+        # The render loop waits 1 / ui_refresh seconds between frames
+        if field == "ui_refresh" and self.ui_refresh <= 0:
+            raise exceptions.EthercutException("ui_refresh must be greater than 0")
+
+    @__parsers.register
+    def control(self, entry):
+        """
+        Collect data for the control socket
+        """
+        field, value = map(lambda x: x.strip(), entry.split("="))
+        self.__setattr__(field, type(self.__getattribute__(field))(value))
+
     @__parsers.register
     def decoders(self, entry):
         """
@@ -127,7 +210,7 @@ geoip_database: Path to Maxmind's database
         Collect data for the geoip2 module
         """
         field, value = [x.strip() for x in entry.split("=")]
-        self.__setattr__(field, value)
+        self.__setattr__(field, type(self.__getattribute__(field))(value))
 
 
 
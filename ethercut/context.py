@@ -10,8 +10,8 @@
 Program context: handles global states and data
 """
 
-import Queue
 import logging
+import ethercut.types.batchqueue as batchqueue
 
 class Context:
     """
@@ -43,7 +43,7 @@ class Context:
     target1    = None
     target2    = None
     injector   = None
-    sniffed_packets = Queue.Queue()
+    sniffed_packets = batchqueue.BatchQueue()
 
     log.setLevel(logging.INFO)
 
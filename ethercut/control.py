@@ -0,0 +1,237 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Control socket: serves the metrics and the state of a running ethercut through a UNIX socket
+"""
+
+import os
+import json
+import stat
+import socket
+import SocketServer
+import ethercut.utils as utils
+import ethercut.metrics as metrics
+import ethercut.exceptions as exceptions
+import ethercut.types.basethread as basethread
+import ethercut.types.reglist as reglist
+
+from ethercut.config import ethconf
+from ethercut.context import ctx
+from ethercut.types.colorstr import CStr
+
+# Longest request accepted, in bytes
+MAX_REQUEST = 4096
+
+# Commands, registered by name
+_commands = reglist.RegList()
+
+def _command(f):
+    """
+    Registers a command, its name is the name of the function without the cmd_ prefix. The
+    commands are called with the master, the request and the connection that sent it
+    """
+    return _commands.register(f, f.__name__[4:])
+
+
+################
+##  Commands  ##
+################
+
+@_command
+def cmd_help(master, req, conn):
+    """
+    Lists the commands
+    """
+    return dict((name, f.__doc__.strip()) for name, f in _commands.iteritems())
+
+@_command
+def cmd_metrics(master, req, conn):
+    """
+    Every metric and the per second rate of the counters since the previous request of the client
+    """
+    snapshot = metrics.registry.snapshot()
+    return { "metrics": snapshot, "rates": conn.meter.rates(snapshot) }
+
+@_command
+def cmd_queues(master, req, conn):
+    """
+    Depth and overload drops of the packet queues
+    """
+    ret = {}
+    for name, q in master.filter.stats.queues:
+        ret[name] = { "depth": q.qsize(), "dropped": q.dropped, "policy": q.policy }
+    return ret
+
+@_command
+def cmd_targets(master, req, conn):
+    """
+    The target list
+    """
+    return [ { "ip": t.ip, "mac": t.mac, "vendor": t.vendor[1], "alive": t.is_alive(),
+               "perm": t.perm, "last_seen": t.lts } for t in ctx.targetlist ]
+
+@_command
+def cmd_flows(master, req, conn):
+    """
+    The flows that have moved more bytes ("n" of them, 10 by default)
+    """
+    ret = []
+    for (proto, saddr, daddr, sport, dport), f in master.filter.top_flows(int(req.get("n", 10))):
+        ret.append({ "proto": proto, "src": utils.ntoa(saddr), "dst": utils.ntoa(daddr),
+                     "sport": sport, "dport": dport, "packets": f.packets, "bytes": f.bytes,
+                     "first": f.first, "last": f.last, "forward": f.forward, "decode": f.decode })
+    return ret
+
+@_command
+def cmd_decoders(master, req, conn):
+    """
+    Packets matched by every decoder
+    """
+    return dict((d.name, d.matched.value()) for d in master.decoders)
+
+@_command
+def cmd_pause(master, req, conn):
+    """
+    Stops passing packets to the decoders
+    """
+    master.filter.set_decoding(False)
+    return { "decoding": False }
+
+@_command
+def cmd_resume(master, req, conn):
+    """
+    Passes packets to the decoders again
+    """
+    master.filter.set_decoding(True)
+    return { "decoding": True }
+
+@_command
+def cmd_inject_rate(master, req, conn):
+    """
+    Changes the maximum packets per second injected ("rate", 0 for no limit)
+    """
+    try:
+        rate = float(req["rate"])
+    except (KeyError, TypeError, ValueError):
+        raise exceptions.EthercutException("A numeric \"rate\" is required")
+    if rate < 0:
+        raise exceptions.EthercutException("The rate can't be negative")
+    master.injector.bucket.set_rate(rate)
+    return { "rate": rate }
+
+
+##############
+##  Server  ##
+##############
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """
+    Serves a connection: every line received is a JSON object with the command in "cmd", the
+    reply is a JSON object in a line with "ok" and the "result" or the "error"
+    """
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        # Every client gets the rates since its own previous request
+        self.meter = metrics.RateMeter(metrics.registry)
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST)
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            self.wfile.write(json.dumps(self.server.execute(line, self), default=str) + "\n")
+            self.wfile.flush()
+
+
+class _Server(SocketServer.ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, master):
+        self.master = master
+        SocketServer.ThreadingUnixStreamServer.__init__(self, path, _Handler)
+
+    def execute(self, line, conn):
+        """
+        Runs a request sent through conn and returns the reply
+        """
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict):
+                raise ValueError("the request must be an object")
+        except ValueError as e:
+            return { "ok": False, "error": "Invalid request: %s" %e }
+        cmd = req.get("cmd")
+        if not isinstance(cmd, basestring) or cmd not in _commands:
+            return { "ok": False, "error": "Unknown command \"%s\"" %cmd }
+        try:
+            return { "ok": True, "result": _commands[cmd](self.master, req, conn) }
+        except Exception as e:
+            return { "ok": False, "error": str(e) }
+
+
+class ControlServer(object):
+    """
+    Control socket. Disabled unless control_socket is set in the configuration file, the
+    socket can only be used by the user running ethercut.
+
+    +param: master - The master
+    """
+
+    __slots__ = [ "master", "path", "server", "thread" ]
+
+    def __init__(self, master):
+        self.master = master
+        self.path = None
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        """
+        Creates the socket and starts serving the requests
+        """
+        self.path = ethconf.control_socket
+        if not self.path or self.server:
+            return
+        # Remove the socket of a previous run, anything else at that path is left alone
+        try:
+            if os.path.lexists(self.path):
+                if not stat.S_ISSOCK(os.lstat(self.path).st_mode):
+                    raise exceptions.EthercutException("Couldn't create the control socket %s: the "
+                                                       "path exists and isn't a socket" %self.path)
+                os.unlink(self.path)
+            umask = os.umask(0o177)
+            try:
+                self.server = _Server(self.path, self.master)
+            finally:
+                os.umask(umask)
+        except (socket.error, OSError) as e:
+            raise exceptions.EthercutException("Couldn't create the control socket %s: %s" %(self.path, e))
+        self.thread = basethread.BaseThread("Control socket", self.server.serve_forever)
+        self.thread.start()
+        ctx.ui.msg("[%s] Listening on %s" %(CStr("CONTROL").cyan, CStr(self.path).green))
+
+    def stop(self):
+        """
+        Stops serving and removes the socket
+        """
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.end()
+        self.server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -10,13 +10,31 @@
 Class responsible of loading and managing the decoders
 """
 
+import ethercut.net.frame as frame
+
 from ethercut.config import ethconf
 from ethercut.context import ctx
 
+# Decoders with more ports than this are not indexed by port, their ports are checked for
+# every packet of their protocol instead
+MAX_INDEXED_PORTS = 1024
+
+_L4_PROTOS = (frame.IPPROTO_TCP, frame.IPPROTO_UDP)
+
+
 class DecoderManager(object):
+    """
+    Keeps the decoder chain and a dispatch index so every packet is only offered to the
+    decoders that registered for its protocol and ports. The handlers are stored as
+    (position in the chain, function) tuples to keep the order of the chain.
+    """
 
     def __init__(self):
         self.chain = []
+        self.index = {}    # (proto, port) -> handlers
+        self.default = {}  # proto -> handlers for the packets without indexed ports
+        self.generic = []  # Handlers for packets that are neither TCP nor UDP
+        self.pairs = {}    # Merged handlers when both ports are indexed
 
     def load(self):
         """
@@ -28,6 +46,42 @@ class DecoderManager(object):
                 break
             else:
                 self.chain.append(ethconf.decoderlist[d]())
+        self.build_index()
+
+    def build_index(self):
+        """
+        Builds the dispatch index from the decoder chain
+        """
+        self.index = {}
+        self.pairs = {}
+        self.default = dict((p, []) for p in _L4_PROTOS)
+        self.generic = []
+        keyed = []
+
+        for pos, d in enumerate(self.chain):
+            protos = _L4_PROTOS if d.proto is None else (d.proto,)
+            if not d.ports:
+                # Every port of its protocols (every packet if it has no protocol)
+                if d.proto is None:
+                    self.generic.append((pos, d.dispatch))
+                for p in protos:
+                    self.default[p].append((pos, d.dispatch))
+            elif len(d.ports) > MAX_INDEXED_PORTS:
+                # Too wide to be indexed, let the decoder check the ports
+                for p in protos:
+                    self.default[p].append((pos, d.decode))
+            else:
+                for p in protos:
+                    for port in d.ports:
+                        keyed.append(((p, port), (pos, d.dispatch)))
+
+        # Packets with indexed ports also go to the decoders of the default bucket
+        for key, handler in keyed:
+            if key not in self.index:
+                self.index[key] = list(self.default[key[0]])
+            self.index[key].append(handler)
+        for handlers in self.index.itervalues():
+            handlers.sort()
 
     def register(self):
         """
@@ -36,13 +90,33 @@ class DecoderManager(object):
         for x in map(lambda x: "ethercut.decoders.%s"%x, ethconf.decodermodules):
             __import__(x, globals(), locals(), [], 0)
 
+    def handlers(self, packet):
+        """
+        Returns the handlers a packet must be dispatched to
+        """
+        proto = packet.proto
+        if proto not in self.default:
+            return self.generic
+        skey = (proto, packet.sport)
+        dkey = (proto, packet.dport)
+        shandlers = self.index.get(skey)
+        dhandlers = self.index.get(dkey)
+        if shandlers is None:
+            return self.default[proto] if dhandlers is None else dhandlers
+        if dhandlers is None or skey == dkey:
+            return shandlers
+        try:
+            return self.pairs[(skey, dkey)]
+        except KeyError:
+            merged = self.pairs[(skey, dkey)] = sorted(set(shandlers) | set(dhandlers))
+            return merged
+
     def decode(self, packet):
         """
-        Starts the decoder chain and passes the packet through all decoders
+        Passes the packet through the decoders that registered for it
         """
-        for d in self.chain:
-            d.decode(packet)
-            ctx.ui.flush()  # Flushes all the messages printed by the decoders
+        for pos, handler in self.handlers(packet):
+            handler(packet)
 
     def __iter__(self):
         return iter(self.chain)
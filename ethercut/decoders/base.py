@@ -11,6 +11,8 @@
 Base classes for all decoders
 """
 
+import ethercut.metrics as metrics
+
 class _Decoder_metaclass(type):
     def __new__(cls, name, supers, dct):
         if "__slots__" not in dct:
@@ -37,22 +39,44 @@ class _Decoder_metaclass(type):
 
 class Decoder:
 
-    __slots__ = [ "name", "ports" ]
+    __slots__ = [ "name", "ports", "matched" ]
 
     __metaclass__ = _Decoder_metaclass
 
     ports = []
 
+    # Layer 4 protocol of the packets this decoder wants (IPPROTO_TCP, IPPROTO_UDP or None for
+    # any packet). The decoder manager uses it along with the ports to dispatch the packets.
+    proto = None
+
     def __init__(self):
         self.name = self._name or self.__class__.__name__
+        # Packets that passed the filter
+        self.matched = metrics.registry.counter("decoder.%s" %self.name)
 
     def decode(self, packet):
         """
-        Runs the packet through the filter and if it matches it, calls on_packet()
+        Checks the ports of the packet and if they match, dispatches it
         """
         if not self.ports or packet.sport in self.ports or packet.dport in self.ports:
-            if self.filter(packet):
-                self.on_packet(packet)
+            self.dispatch(packet)
+
+    def dispatch(self, packet):
+        """
+        Runs the packet through the filter and if it matches it, calls on_packet().
+        The ports are not checked, the decoder manager only dispatches the packets that belong
+        to this decoder.
+        """
+        if self.filter(packet):
+            self.matched.inc()
+            self.on_packet(packet)
+
+    def forked(self):
+        """
+        Called in every worker process of the koala filter right after it is created. Decoders
+        that run threads must start them again, threads don't survive the fork.
+        """
+        pass
 
     def on_packet(self, packet):
         """
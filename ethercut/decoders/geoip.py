@@ -16,68 +16,129 @@ try:
 except ImportError:
     raise exceptions.EthercutException("geoip2 not available, GeoIP parser won't be laoded")
 
+import threading
+import collections
+import ethercut.utils as utils
 import ethercut.decoders.base as base
-import ethercut.net.network as network
+import ethercut.types.basethread as basethread
+import ethercut.types.batchqueue as batchqueue
 
 from ethercut.context import ctx
 from ethercut.config import ethconf
 from ethercut.types.colorstr import CStr
 
+# Private networks as (network, mask) integers
+PRIVATE_NETS = [ (utils.aton(n), utils.aton(m)) for n, m in (("10.0.0.0", "255.0.0.0"),
+                                                             ("172.16.0.0", "255.240.0.0"),
+                                                             ("192.168.0.0", "255.255.0.0"),
+                                                             ("169.254.0.0", "255.255.0.0")) ]
+
+def is_private(ip):
+    """
+    Returns True if the IP address (as an integer) belongs to a private network
+    """
+    for net, mask in PRIVATE_NETS:
+        if ip & mask == net:
+            return True
+    return False
+
 
 class GeoDecoder(base.Decoder):
+    """
+    Prints the location of the global IP addresses. The locations are looked up by a pool of
+    worker threads, the decode thread only queues the addresses it hasn't seen recently. The
+    lookup queue is bounded by the cache size, an address that doesn't fit is looked up with
+    a later packet.
+    """
 
-    __slots__ = [ "reader", "known", "priv_net" ]
+    __slots__ = [ "reader", "cache", "maxsize", "lock", "lookups", "workers" ]
 
     name = "GEO"
 
-    # Private networks
-    priv_net = [ network.Network("10.0.0.0", "255.0.0.0"),
-                 network.Network("172.16.0.0", "255.240.0.0"),
-                 network.Network("192.168.0.0", "255.255.0.0"),
-                 network.Network("169.254.0.0", "255.255.0.0") ]
-
     def __init__(self):
         super(GeoDecoder, self).__init__()
-        self.reader = geoip2.database.Reader(ethconf.geoip_database)
-        self.known = [] # List of known global IP addresses
+        self.reader = geoip2.database.Reader(ethconf.geoip_database, mode=geoip2.database.MODE_MMAP)
+        # LRU of known global IP addresses (integers) and their location message
+        self.cache = collections.OrderedDict()
+        self.maxsize = ethconf.geoip_cache_size
+        self.start_workers()
+
+    def start_workers(self):
+        """
+        Starts the lookup threads
+        """
+        self.lock = threading.Lock()
+        # Addresses waiting to be looked up as (ip, addresses) tuples
+        self.lookups = batchqueue.BatchQueue(self.maxsize, batchqueue.DROP_NEWEST)
+        self.workers = []
+        for i in xrange(max(1, ethconf.geoip_workers)):
+            w = basethread.BaseThread("GeoIP lookup %d" %i, self.lookup_worker)
+            w.start()
+            self.workers.append(w)
+
+    def forked(self):
+        self.start_workers()
 
     def on_packet(self, packet):
-        global_ip = None
-        src = packet.payload.src
-        dst = packet.payload.dst
-        for n in self.priv_net:
-            if src in n:
-                break
-        else:
-            global_ip = src
-            addresses = "%s >> "+dst
-
-        if not global_ip:
-            for n in self.priv_net:
-                if dst in n:
-                    break
-            else:
-                global_ip = dst
-                addresses = src+" >> %s"
+        src = packet.saddr
+        dst = packet.daddr
+        if src is None:
+            return
 
         # Only global IP addresses can have location
-        if not global_ip:
+        if not is_private(src):
+            global_ip = src
+            addresses = "%s >> "+utils.ntoa(dst)
+        elif not is_private(dst):
+            global_ip = dst
+            addresses = utils.ntoa(src)+" >> %s"
+        else:
             return
 
-        if global_ip not in self.known:
-            self.known.append(global_ip)
-            # Tries to read the location from the database
+        with self.lock:
             try:
-                response = self.reader.city(global_ip)
-            except geoip2.errors.AddressNotFoundError:
-                message = "Address not in database"
-                global_ip = CStr(global_ip).red
-            else:
-                global_ip = CStr(global_ip).green
-                message = "%s, %s. Lat: %s, Long: %s" %(response.subdivisions.most_specific.name,
-                                                        response.country.name,
-                                                        response.location.latitude,
-                                                        response.location.longitude)
-            ctx.ui.user_msg("[%s] %s [%s]"% (CStr(self.name).green,
-                                             addresses%global_ip,
-                                             message))
+                # Known address, just refresh its position in the LRU
+                self.cache[global_ip] = self.cache.pop(global_ip)
+                return
+            except KeyError:
+                if self.lookups.full():
+                    return # Too many lookups pending, don't remember it so it is retried
+                self.cache[global_ip] = None # Pending
+                if len(self.cache) > self.maxsize:
+                    self.cache.popitem(last=False)
+        self.lookups.put((global_ip, addresses))
+
+    def lookup_worker(self):
+        """
+        Worker thread activity, looks up the queued addresses in the database
+        """
+        while True:
+            for ip, addresses in self.lookups.get_batch(64):
+                try:
+                    self.lookup(ip, addresses)
+                except Exception as e:
+                    # A damaged or mismatched database must not stop the worker
+                    ctx.ui.warning("[%s] Couldn't look up %s: %s" %(self.name, utils.ntoa(ip), e))
+
+    def lookup(self, ip, addresses):
+        """
+        Reads the location of ip from the database and prints it
+        """
+        global_ip = utils.ntoa(ip)
+        try:
+            response = self.reader.city(global_ip)
+        except geoip2.errors.AddressNotFoundError:
+            message = "Address not in database"
+            global_ip = CStr(global_ip).red
+        else:
+            global_ip = CStr(global_ip).green
+            message = "%s, %s. Lat: %s, Long: %s" %(response.subdivisions.most_specific.name,
+                                                    response.country.name,
+                                                    response.location.latitude,
+                                                    response.location.longitude)
+        with self.lock:
+            if ip in self.cache:
+                self.cache[ip] = message
+        ctx.ui.user_msg("[%s] %s [%s]"% (CStr(self.name).green,
+                                         addresses%global_ip,
+                                         message))
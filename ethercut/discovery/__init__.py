@@ -10,8 +10,9 @@
 Target discovery package
 """
 
-import time
+import ethercut.utils as utils
 import ethercut.types.ticker as ticker
+import ethercut.types.rangeset as rangeset
 
 from ethercut.context import ctx
 from ethercut.types.colorstr import CStr
@@ -41,7 +42,7 @@ class Discovery(object):
     def __init__(self):
         self.running = False
         self.targetlist = ctx.targetlist
-        self.scanlist = []
+        self.scanlist = None
         self.profile = None
         self.agent = None
         self.prev = [] # Keeps track of the previous alive targets
@@ -104,27 +105,24 @@ class Discovery(object):
     @staticmethod
     def build_scan_list():
         """
-        Given the two target groups, generate a list of addresses to scan for
+        Given the two target groups, generate the set of addresses to scan for (as integers)
         """
         if ctx.target1.ip is None or ctx.target2.ip is None:
+            first, last = ctx.network.host_range
+            scanlist = rangeset.IntRangeSet([(first, last)] if first <= last else [])
             ctx.ui.msg("Targeting the whole network (%s)" %CStr(str(ctx.network)).yellow)
-            ctx.ui.msg("Ethercut needs to precompute all the possible hosts in the network, this could take a while...")
-            ctx.ui.flush()
-            start = time.time()
-            scanlist = filter(lambda ip: ip != ctx.iface.ip and ip != ctx.gateway.ip, ctx.network.all_hosts)
-            end = time.time()
-            ctx.ui.msg("Done in %0.2fms" %(1000*(end-start)))
         else:
-            # Start with target1
-            scanlist = ctx.target1.ip
-            # Merge target2
-            for t in ctx.target2.ip:
-                if t not in scanlist and t != ctx.iface.ip and t != ctx.gateway.ip:
-                    scanlist.append(t)
+            # Merge target1 and target2
+            scanlist = rangeset.IntRangeSet((x, x) for x in map(utils.aton, ctx.target1.ip + ctx.target2.ip))
 
+        # Never scan ourselves nor the gateway
+        scanlist.discard(utils.aton(ctx.iface.ip))
+        scanlist.discard(utils.aton(ctx.gateway.ip))
+
+        if ctx.target1.ip is not None and ctx.target2.ip is not None:
             s = ""
             ln = 0
-            for t in scanlist:
+            for t in map(utils.ntoa, scanlist):
                 if ln > 90:
                     # Truncate and show the last item
                     s += "\n\t"
@@ -136,6 +134,8 @@ class Discovery(object):
             if s.endswith(", "):
                 s = s[:-2] # Remove the last ", "
             ctx.ui.msg("Targeting %s hosts: \n\t%s" %(len(scanlist), s))
+        else:
+            ctx.ui.msg("Targeting %s hosts" %len(scanlist))
 
         return scanlist
 
@@ -160,7 +160,6 @@ class Discovery(object):
             ctx.ui.user_msg("[%s] Targets lost:" %CStr("DISCOVERY").green)
             for t in lost:
                 ctx.ui.user_msg("\t[%s] %s" %(CStr("LOST").red, repr(t)))
-        ctx.ui.flush()
         # Update previous list
         self.prev = self.targetlist.targets.values()
 
@@ -10,21 +10,26 @@
 ARP cache reading module
 """
 
+import time, socket
 import ethercut.shell as shell
 import ethercut.utils as utils
+import ethercut.const as const
 import ethercut.net.target as target
 import ethercut.types.basethread as basethread
 
-from ethercut.context import context
+from ethercut.context import ctx
 
 
 class ARPReader(basethread.BaseThread):
     """
     This class keeps track of the hosts that are in the ARP cache table.
 
-    +param: iface - Name of the interface which the targets belong to
-    +param: hosts - List of Target instances to look for in the cache
-    +param: ts    - Delay between lookups in seconds (default 3)
+    On Linux the neighbour table is followed through rtnetlink notifications, if the netlink
+    socket can't be opened /proc/net/arp is polled and diffed instead. Other systems poll the
+    output of arp.
+
+    +param: scanlist - IntRangeSet with the addresses to look for in the cache
+    +param: ts       - Delay between refreshes in seconds (default 3)
     """
 
     def __init__(self, scanlist):
@@ -33,11 +38,68 @@ class ARPReader(basethread.BaseThread):
         self.iface = ctx.iface
         self.scanlist  = scanlist
         self.targetlist= ctx.targetlist
+        self.cache = {} # Current view of the ARP cache {ip: mac}
 
         # For update notifications
         self.prev = []
 
     def run(self):
+        if const.LINUX:
+            try:
+                self.watch_netlink()
+                return
+            except (socket.error, IOError, AttributeError):
+                pass # No netlink support, poll /proc/net/arp
+            self.watch_proc()
+        else:
+            self.watch_shell()
+
+    def watch_netlink(self):
+        """
+        Follows the neighbour table with rtnetlink events
+        """
+        import ethercut.platform.netlink as netlink
+        import ethercut.platform.linux as linux
+
+        nl = netlink.NeighbourSocket(linux.linux_ifindex(self.iface.name))
+        try:
+            nl.request_dump()
+            last = time.time()
+            while self.running:
+                events = nl.recv(self.ts)
+                for ev, ip, mac, state in events or ():
+                    if ev == netlink.RTM_NEWNEIGH and mac and state & netlink.NUD_VALID:
+                        self.update(utils.ntoa(ip), utils.ntom(mac))
+                    else:
+                        # The target will be considered lost once its stale time expires
+                        self.cache.pop(utils.ntoa(ip), None)
+                now = time.time()
+                if now - last >= self.ts:
+                    self.refresh()
+                    last = now
+        finally:
+            nl.close()
+
+    def watch_proc(self):
+        """
+        Polls /proc/net/arp and processes the entries that changed
+        """
+        import ethercut.platform.linux as linux
+
+        while self.running:
+            cache = linux.linux_arp_cache(self.iface.name)
+            for ip in set(self.cache) - set(cache):
+                del self.cache[ip]
+            for ip, mac in cache.iteritems():
+                if self.cache.get(ip) != mac:
+                    self.update(ip, mac)
+            self.refresh()
+            time.sleep(self.ts)
+
+    def watch_shell(self):
+        """
+        Polls the output of arp
+        """
         sh = shell.Shell()
         while self.running:
             # Get the list of targets (only those ones availables on our interface)
@@ -49,20 +111,35 @@ class ARPReader(basethread.BaseThread):
                 data = l.split()
                 ip = data[1][1:-1] # Remove parenthesis
                 mac= data[3]
+                if self.cache.get(ip) != mac:
+                    self.update(ip, mac)
+            self.refresh()
+            time.sleep(self.ts)
 
-                if ip not in self.scanlist or not utils.is_mac(mac):
-                    continue # Skip this host (incomplete or not in scanlist)
+    def update(self, ip, mac):
+        """
+        Processes a new or changed ARP cache entry
+        """
+        if not utils.is_ip(ip) or utils.aton(ip) not in self.scanlist or not utils.is_mac(mac):
+            return # Skip this host (incomplete or not in scanlist)
+        mac = utils.normalize(mac)
+        self.cache[ip] = mac
 
-                # Check if the host is already in the list
-                targ = self.targetlist.get_bymac(mac)
-                if not targ:
-                    self.targetlist.append(target.Target(ip, mac))
-                else:
-                    targ.seen()
+        # Check if the host is already in the list
+        targ = self.targetlist.get_bymac(mac)
+        if not targ:
+            self.targetlist.append(target.Target(ip, mac))
+        else:
+            targ.seen()
 
-                # Don't continue if the thread was requested to terminate it's activity
-                if not self.running:
-                    break
+    def refresh(self):
+        """
+        Marks as seen the targets that are still in the ARP cache
+        """
+        for mac in self.cache.values():
+            targ = self.targetlist.get_bymac(mac)
+            if targ:
+                targ.seen()
 
     def stop(self):
         """
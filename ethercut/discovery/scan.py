@@ -11,6 +11,8 @@ Target scanning module (ActiveScan and PassiveScan)
 """
 
 import pcap, time
+import ethercut.utils as utils
+import ethercut.net.frame as frame
 import ethercut.net.target as target
 import ethercut.types.ticker as ticker
 import ethercut.exceptions as exceptions
@@ -18,7 +20,9 @@ import ethercut.types.basethread as basethread
 
 from ethercut.context import ctx
 from ethercut.types.colorstr import CStr
-from scapy.layers.l2 import Ether, ARP
+
+# Number of probes pushed to the injector at once
+PROBE_BATCH = 256
 
 class ActiveScan(object):
 
@@ -48,23 +52,16 @@ class ActiveScan(object):
         """
         Probing thread activity, probe the network for targets
         """
-        # Start with an initial scan
-        for i, h in enumerate(self.scanlist):
-            ctx.injector.push(self.get_probe(h))
+        # The scan list is walked in chunks, the addresses are never expanded all at once
+        for chunk in self.scanlist.chunks(PROBE_BATCH):
+            ctx.injector.push_batch([self.get_probe(h) for h in chunk])
 
     def get_probe(self, ip):
         """
-        Get a probe for an ip address
+        Get a probe (raw ARP request) for an ip address given as an integer
         """
-        # Build an ARP query message
-        pkt = Ether(src=ctx.iface.mac,
-                    dst="ff:ff:ff:ff:ff:ff",
-                    type=0x0806) /\
-              ARP(hwsrc=ctx.iface.mac,
-                  psrc=ctx.iface.ip,
-                  hwdst="00:00:00:00:00:00",
-                  pdst=ip)
-        return pkt
+        return frame.arp_frame(frame.ARP_REQUEST, ctx.iface.mac, ctx.iface.ip,
+                               frame.ETH_ZERO, utils.ntoa(ip), frame.ETH_BROADCAST)
 
     def acquiring(self):
         """
@@ -83,10 +80,14 @@ class ActiveScan(object):
                     self.running = False
                 continue
             ts, pkt = ret
-            packet = Ether(str(pkt))
-            if packet.psrc in self.scanlist:
-                targ = ctx.targetlist.get_bymac(packet.hwsrc)
+            arp = frame.parse_arp(pkt)
+            if arp is None:
+                continue
+            op, hwsrc, psrc, hwdst, pdst = arp
+            if psrc in self.scanlist:
+                hwsrc = utils.ntom(hwsrc)
+                targ = ctx.targetlist.get_bymac(hwsrc)
                 if not targ: # New target, add it to the list
-                    ctx.targetlist.append(target.Target(packet.psrc, packet.hwsrc))
+                    ctx.targetlist.append(target.Target(utils.ntoa(psrc), hwsrc))
                 else:
                     targ.seen()
@@ -0,0 +1,137 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Packet dump thread module
+"""
+
+import os
+import Queue
+import struct
+import ethercut.types.basethread as basethread
+
+# Pcap file format (microsecond resolution)
+PCAP_MAGIC   = 0xa1b2c3d4
+_PCAP_HEADER = struct.Struct("<IHHiIII")
+_PCAP_RECORD = struct.Struct("<IIII")
+
+
+class DumpWriter(basethread.BaseThread):
+    """
+    Packet dump thread: writes the raw captured frames to a pcap file.
+    The file is kept open for the whole capture and written through a large buffer, so
+    the capturing thread only has to push the frames into the queue.
+
+    If a size or time limit is set, the dump file will be rotated to <file>_01, <file>_02...
+    when it is reached. If maxfiles is set, only the last maxfiles files are kept (the
+    oldest one will be overwritten).
+
+    +param: path     - Dump file
+    +param: linktype - Data link type of the captured frames
+    +param: snaplen  - Snapshot length of the capture
+    +param: maxsize  - Maximum size of a dump file in bytes (0 for no limit)
+    +param: maxfiles - Number of dump files to keep when rotating (0 for no limit)
+    +param: maxtime  - Maximum time in seconds covered by a dump file (0 for no limit)
+    """
+
+    bufsize = 1 << 20
+
+    def __init__(self, path, linktype=1, snaplen=65535, maxsize=0, maxfiles=0, maxtime=0):
+        super(DumpWriter, self).__init__("Packet dump")
+        self.queue = Queue.Queue()
+        self.path = path
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.maxsize = maxsize
+        self.maxfiles = maxfiles
+        self.maxtime = maxtime
+
+        self.file = None
+        self.index = 0     # Index of the current dump file
+        self.size = 0      # Bytes written in the current dump file
+        self.opened = None # Timestamp of the first packet in the current dump file
+
+    def push(self, ts, buf):
+        """
+        Queue a captured frame to be dumped
+        """
+        self.queue.put((ts, buf))
+
+    def filename(self, index):
+        """
+        Returns the name of the index-th dump file
+        """
+        if index == 0:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return "%s_%0.2d%s" %(root, index, ext)
+
+    def open(self, append=False):
+        """
+        Open the current dump file and write the pcap header. If append is True and the
+        file already exists, the packets will be appended to it.
+        """
+        name = self.filename(self.index)
+        if append and os.path.exists(name) and os.path.getsize(name) > 0:
+            self.file = open(name, "ab", self.bufsize)
+            self.size = os.path.getsize(name)
+        else:
+            self.file = open(name, "wb", self.bufsize)
+            self.file.write(_PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, self.snaplen, self.linktype))
+            self.size = _PCAP_HEADER.size
+        self.opened = None
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def rotate(self):
+        """
+        Close the current dump file and start writing the next one
+        """
+        self.close()
+        self.index += 1
+        if self.maxfiles and self.index >= self.maxfiles:
+            self.index = 0
+        self.open()
+
+    def write(self, ts, buf):
+        """
+        Write a frame in the dump file
+        """
+        if self.opened is None:
+            self.opened = ts
+        elif ((self.maxsize and self.size >= self.maxsize) or
+              (self.maxtime and ts - self.opened >= self.maxtime)):
+            self.rotate()
+            self.opened = ts
+
+        sec = int(ts)
+        caplen = len(buf)
+        self.file.write(_PCAP_RECORD.pack(sec, int((ts - sec) * 1000000), caplen, caplen))
+        self.file.write(buf)
+        self.size += _PCAP_RECORD.size + caplen
+
+    def run(self):
+        self.open(append=True)
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None: # Terminate activity when None is received
+                    break
+                self.write(*item)
+        finally:
+            self.close()
+
+    def end(self, join=True):
+        if not self.running:
+            return
+        # Put None in the queue so the pending frames are written before closing the file
+        self.queue.put(None)
+        super(DumpWriter, self).end(join)
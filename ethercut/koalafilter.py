@@ -10,15 +10,31 @@
 Koala filter
 """
 
-import Queue, socket
+import time
+import heapq
+import socket
+import multiprocessing
+import ethercut.utils as utils
+import ethercut.metrics as metrics
+import ethercut.koalashard as koalashard
+import ethercut.net.flow as flow
+import ethercut.net.rawsock as rawsock
 import ethercut.platform as platform
+import ethercut.net.target as target
 import ethercut.exceptions as exceptions
+import ethercut.types.ticker as ticker
 import ethercut.types.basethread as basethread
+import ethercut.types.batchqueue as batchqueue
 
+from ethercut.config import ethconf
 from ethercut.context import ctx
 from ethercut.types.colorstr import CStr
 
-import scapy.layers.inet
+# Maximum number of packets that a filter thread takes from its queue on every wake-up
+BATCH_SIZE = 256
+
+# Seconds to wait for every filter thread to exit
+JOIN_TIMEOUT = 5
 
 
 class KoalaFilter(object):
@@ -26,19 +42,37 @@ class KoalaFilter(object):
     __slots__ = [ "stats", "eval_thread", "forward_thread",
                   "decode_thread", "to_forward", "to_decode",
                   "sniffed_packets", "decoder_manager",
-                  "from_file", "enabled", "running" ]
+                  "from_file", "enabled", "running", "inline",
+                  "iface_mac", "iface_ip", "matcher", "flows",
+                  "workers", "relay", "reports", "decoding" ]
 
     def __init__(self, decmanager):
         self.stats = FilterStats()
         self.decoder_manager = decmanager
-        self.to_forward = Queue.Queue()
-        self.to_decode = Queue.Queue()
+        self.to_forward = batchqueue.BatchQueue()
+        self.to_decode = batchqueue.BatchQueue()
         # Need to be configured when the context is updated
         self.from_file = None
         self.sniffed_packets = None
+        # Our addresses in the same form as the RawFrame fields
+        self.iface_mac = None
+        self.iface_ip = None
+        # Compiled TARGET specifications
+        self.matcher = None
+        # Connection tracking
+        self.flows = None
 
         self.enabled = False
         self.running = False
+        # Set by the sniffer when it hands the packets to process() itself
+        self.inline = False
+        # Worker processes (ShardWorker) when the packets are filtered in several processes,
+        # the thread that prints their messages and their reports (ShardReports)
+        self.workers = []
+        self.relay = None
+        self.reports = None
+        # Cleared to stop passing packets to the decoders, shared with the workers
+        self.decoding = multiprocessing.Value("b", 1, lock=False)
 
         # Threads that make up the filter activity
 
@@ -73,9 +107,39 @@ class KoalaFilter(object):
         else:
             self.enabled = True
             self.sniffed_packets = ctx.sniffed_packets
+            # Bound the queues, forwarding must never be slowed down by the decoders
+            try:
+                self.sniffed_packets.set_limits(ethconf.sniff_queue_size, ethconf.sniff_queue_policy)
+                self.to_forward.set_limits(ethconf.forward_queue_size, ethconf.forward_queue_policy)
+                self.to_decode.set_limits(ethconf.decode_queue_size, ethconf.decode_queue_policy)
+            except ValueError as e:
+                raise exceptions.EthercutException(str(e))
+            self.stats.queues = [ ("sniffed", self.sniffed_packets) ]
+            self.workers = []
+            if ethconf.workers > 1 and not self.inline:
+                # Every worker has its own forward and decode queues
+                self.stats.share(multiprocessing.Array("L", ethconf.workers * len(FilterStats.SHARED),
+                                                       lock=False))
+                self.relay = koalashard.UIRelay()
+                self.workers = [koalashard.ShardWorker(self, i, self.relay.sink)
+                                for i in xrange(ethconf.workers)]
+                self.stats.queues += [ ("shard %d" %i, w.channel.ring) for i, w in enumerate(self.workers) ]
+                self.share_reports(koalashard.ShardReports(self.workers))
+            else:
+                self.stats.queues += [ ("forward", self.to_forward), ("decode", self.to_decode) ]
+            if ctx.injector is not None and ctx.injector.enabled:
+                self.stats.queues.append(("inject", ctx.injector.queue))
+            for name, q in self.stats.queues:
+                metrics.registry.gauge("queue.%s" %name.replace(" ", ""), q.qsize)
+            self.matcher = target.TargetMatcher(ctx.target1, ctx.target2)
+            self.flows = flow.FlowTable(ethconf.flow_table_size, ethconf.flow_timeout)
+            metrics.registry.gauge("filter.flows", self.flow_count)
 
             # Configure the filter for live or offline sniffing
             self.from_file = ctx.opt.sniff.read
+            if not self.from_file:
+                self.iface_mac = utils.mton(ctx.iface.mac)
+                self.iface_ip = utils.aton(ctx.iface.ip)
 
             if self.from_file:
                 # No packets to drop nor forward while sniffing offline!
@@ -97,12 +161,17 @@ class KoalaFilter(object):
 
             else:
                 # The koala filter will handle dropping and forwarding
+                if ethconf.forward_mode not in ("l2", "l3"):
+                    raise exceptions.EthercutException("Invalid forwarding mode \"%s\" (l2 or l3)"
+                                                       %ethconf.forward_mode)
                 platform.disable_ip_forward()
                 drop = CStr("on").green
-                forward = CStr("on").green
+                forward = CStr("on (%s)" %ethconf.forward_mode).green
 
             decode = CStr("on").green
             ctx.ui.msg("Koala filter enabled | Dropping: %s | Forwarding: %s | Decoding: %s" %(drop, forward, decode))
+            if self.workers:
+                ctx.ui.msg("Worker processes: %s (packets sharded by flow)" %CStr(len(self.workers)).green)
 
 
     def eval_packets(self):
@@ -111,84 +180,292 @@ class KoalaFilter(object):
         This thread evaluates the packets from the sniffed queue and determines whether
         they should be forwarded or dropped and decoded or ignored.
         """
-        while self.running:
-            try:
-                packet = self.sniffed_packets.get(block=False, timeout=1)
-            except Queue.Empty:
-                continue
-
-            if packet is None:
-                # There are no more packets to filter
+        while True:
+            # Block until there are packets to filter and take them all at once
+            batch = self.sniffed_packets.get_batch(BATCH_SIZE)
+            start = time.time()
+            forward = []
+            decode = []
+            done = False
+
+            for packet in batch:
+                if packet is None:
+                    # There are no more packets to filter
+                    done = True
+                    break
+
+                try:
+                    fwd, dec = self.evaluate(packet)
+                except Exception:
+                    # A malformed packet must not stop the filter
+                    self.stats.errors.inc()
+                    continue
+                if fwd or dec:
+                    # Only the frames kept are copied out of a worker ring
+                    packet.detach()
+                if fwd:
+                    forward.append(packet)
+                if dec:
+                    decode.append(packet)
+
+            if batch and not done:
+                self.stats.eval_time.observe((time.time() - start) / len(batch), len(batch))
+            self.to_forward.put_batch(forward)
+            self.to_decode.put_batch(decode)
+
+            if batch and not done:
+                # Forget the flows that have been idle for too long
+                self.flows.sweep(batch[-1].time)
+
+            if done:
                 self.to_forward.put(None)
                 self.to_decode.put(None)
                 break
-            else:
-                # Add packet to statistics
-                self.stats.total += 1
 
-            drop = True
-            ignore = True
-
-            try:
-                # Don't drop packets that come from a file or that have our MAC address as
-                # the ethernet destination field and different IP address on the IP destination
-                # field (those packets must be forwarded)
-                if self.from_file or (ctx.iface.mac == packet.dst and ctx.iface.ip != packet.payload.dst):
-                    drop = False
-
-                    # Now check if we can decode the packet or it should be ignored. We have to
-                    # check if it complies with the TARGET specifications
-
-                    # Check from TARGET1 to TARGET2
-                    if (ctx.target1.check((packet.payload.src, packet.src, packet.sport)) and
-                    ctx.target2.check((packet.payload.dst, packet.dst, packet.dport))):
-                        ignore = False
+    def dispatch_packets(self):
+        """
+        Activity of the evaluation thread when the filter runs in worker processes.
+        Every packet is sent to the worker of its flow, so the packets of a flow are handled
+        in order by the same worker. The workers get the target list every time it changes.
+        The frames sent to our MAC address may have to be forwarded, they are sent with
+        priority.
+        """
+        n = len(self.workers)
+        mac = self.iface_mac
+        version = None
+        while True:
+            batch = self.sniffed_packets.get_batch(BATCH_SIZE)
+
+            if version != ctx.targetlist.version:
+                version = ctx.targetlist.version
+                for w in self.workers:
+                    w.channel.send_targets(ctx.targetlist)
+
+            shards = [[] for i in xrange(n)]
+            priority = [[] for i in xrange(n)]
+            done = False
+            for packet in batch:
+                if packet is None:
+                    done = True
+                    break
+                if mac is not None and packet.eth_dst == mac:
+                    priority[flow.flow_shard(packet, n)].append(packet)
+                else:
+                    shards[flow.flow_shard(packet, n)].append(packet)
 
-                    # Check from TARGET2 to TARGET1
-                    elif (ctx.target2.check((packet.payload.src, packet.src, packet.sport)) and
-                    ctx.target1.check((packet.payload.dst, packet.dst, packet.dport))):
-                        ignore = False
+            for w, packets, prio in zip(self.workers, shards, priority):
+                if packets or prio:
+                    w.channel.send(packets, prio)
 
-            except AttributeError:
-                # The packet doesn't have an IP datagram or a TCP/UDP segment ecapsulated
-                pass
+            if done:
+                for w in self.workers:
+                    w.channel.close()
+                break
 
-            if not self.from_file:
-                if drop:
-                    self.stats.dropped += 1
-                else:
-                    self.to_forward.put(packet)
+    def run_shard(self, shard, channel, publish):
+        """
+        Runs the filter in a worker process on the packets read from channel. The evaluation
+        is done in the calling thread and the counters are published in the shared stats every
+        publish seconds.
+        """
+        self.workers = []
+        stats = self.stats
+        stats.share(stats.shards, shard)
+        self.share_reports(None)
+        self.sniffed_packets = channel
+        channel.reporter = self.shard_report
+
+        # New queues and threads, the ones of the main process may have been in use when it
+        # was forked
+        self.to_forward = batchqueue.BatchQueue(ethconf.forward_queue_size, ethconf.forward_queue_policy)
+        self.to_decode = batchqueue.BatchQueue(ethconf.decode_queue_size, ethconf.decode_queue_policy)
+        self.forward_thread = basethread.BaseThread("Packet forward", self.forward_packets)
+        self.decode_thread = basethread.BaseThread("Packet decode", self.decode_packets)
+        publisher = ticker.Ticker(publish, stats.publish, "Stats publisher", shard)
+
+        if not self.from_file:
+            self.forward_thread.start()
+        self.decode_thread.start()
+        publisher.start()
+        self.eval_packets()
+        self.forward_thread.end(timeout=JOIN_TIMEOUT)
+        self.decode_thread.end(timeout=JOIN_TIMEOUT)
+        publisher.end()
+        stats.publish(shard)
+
+    def share_reports(self, reports):
+        """
+        Adds the decoder counters and the latency histograms of the worker processes, read
+        through reports (a ShardReports), to the ones of this process. None stops adding them.
+        """
+        self.reports = reports
+        for h in self.stats.histograms():
+            h.remote = None
+            if reports is not None:
+                h.remote = lambda h=h: [r["histograms"][h.name] for r in reports.get()]
+        for d in self.decoder_manager:
+            d.matched.remote = None
+            if reports is not None:
+                d.matched.remote = lambda c=d.matched: sum(r["decoders"].get(c.name, 0)
+                                                           for r in reports.get())
+
+    def shard_report(self, nflows):
+        """
+        Returns the report of a worker process: its number of flows and its nflows top flows,
+        the packets matched by every decoder and the latency histograms
+        """
+        return { "flow_count": len(self.flows),
+                 "flows": self.flows.top(nflows) if nflows else [],
+                 "decoders": dict((d.matched.name, d.matched.own()) for d in self.decoder_manager),
+                 "histograms": dict((h.name, h.merged()) for h in self.stats.histograms()) }
 
-            if not ignore:
-                self.to_decode.put(packet)
-            else:
-                self.stats.ignored += 1
+    def flow_count(self):
+        """
+        Number of flows tracked, those of the worker processes included
+        """
+        n = len(self.flows) if self.flows is not None else 0
+        if self.reports is not None:
+            n += sum(r["flow_count"] for r in self.reports.get())
+        return n
 
+    def top_flows(self, n=10):
+        """
+        Returns a list with the n flows that have moved more bytes as (key, flow) tuples, those
+        of the worker processes included
+        """
+        if self.flows is None:
+            return []
+        top = self.flows.top(n)
+        if self.reports is not None:
+            for r in self.reports.get(n):
+                top.extend(r["flows"])
+            top = heapq.nlargest(n, top, key=lambda x: x[1].bytes)
+        return top
+
+    def evaluate(self, packet):
+        """
+        Determines whether a packet should be forwarded and whether it should be decoded.
+        Returns a tuple (forward, decode)
+        """
+        # Add packet to statistics
+        self.stats.total.inc()
+
+        forward = False
+        decode = False
+
+        # Don't drop packets that come from a file or that have our MAC address as
+        # the ethernet destination field and different IP address on the IP destination
+        # field (those packets must be forwarded)
+        daddr = packet.daddr
+        if self.from_file or (daddr is not None and packet.eth_dst == self.iface_mac and
+                              daddr != self.iface_ip):
+            forward = not self.from_file
+
+            # Now check if we can decode the packet or it should be ignored. Only packets with
+            # an IP datagram and a TCP/UDP segment encapsulated can be decoded. The verdict is
+            # cached in the flow table so the TARGET specifications are only checked for the
+            # first packet of every flow
+            sport = packet.sport
+            if sport is not None:
+                key = (packet.proto, packet.saddr, daddr, sport, packet.dport)
+                entry = self.flows.lookup(key, packet.time)
+                if entry is None:
+                    direction = self.matcher.match(packet.saddr, packet.eth_src, sport,
+                                                   daddr, packet.eth_dst, packet.dport)
+                    entry = self.flows.add(key, forward, direction, packet.time)
+                entry.packets += 1
+                entry.bytes += len(packet)
+                entry.last = packet.time
+                decode = entry.decode and self.decoding.value
+
+        if not forward and not self.from_file:
+            self.stats.dropped.inc()
+
+        if not decode:
+            self.stats.ignored.inc()
+
+        return forward, decode
 
     def forward_packets(self):
         """
         This function represents the activity of packet forwarding.
-        Takes the packets from to_forward queue and sends them back to the wire at layer 3 to
-        their real destination.
+        Takes the packets from to_forward queue and sends them back to the wire to their real
+        destination.
+
+        In "l2" forwarding mode only the ethernet addresses of the captured frame are rewritten
+        (our MAC as source and the real destination's MAC) and the frame is sent through our
+        interface. Packets whose destination MAC is unknown, and all the packets in "l3" mode,
+        are sent at layer 3 and the kernel does the routing.
+
+        A packet that can't be sent (e.g. a frame coalesced by GRO that is larger than the MTU)
+        is counted in the forwarding errors and skipped.
         """
 
-        # Use dnet to send the packets at layer 3
+        # Use a raw socket to send the packets at layer 3
         snd = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
         snd.setsockopt(socket.SOL_IP, socket.IP_HDRINCL, 1)
 
-        while self.running:
-            try:
-                packet = self.to_forward.get(block=False, timeout=1)
-            except Queue.Empty:
-                continue
-
-            if packet is None:
-                # No more packets to forward
-                break
-
-            # Send the packet at layer 3 and let the kernel do the forwarding
-            snd.sendto(str(packet.payload), (packet.payload.dst, 0))
-            self.stats.forwarded += 1
+        l2snd = None
+        if ethconf.forward_mode == "l2":
+            l2snd = rawsock.L2Socket(ctx.iface.name)
+            gwmac = utils.mton(ctx.gateway.mac)
+            net32 = ctx.network.net32
+            mask32 = ctx.network.mask32
+            version = None
+
+        while True:
+            batch = self.to_forward.get_batch(BATCH_SIZE)
+            start = time.time()
+
+            if l2snd and version != ctx.targetlist.version:
+                # Targets have changed, rebuild the IP to MAC table
+                version = ctx.targetlist.version
+                neighbours = self.neighbours()
+
+            for packet in batch:
+                if packet is None:
+                    # No more packets to forward
+                    return
+
+                if l2snd:
+                    daddr = packet.daddr
+                    dmac = neighbours.get(daddr)
+                    if dmac is None and daddr & mask32 != net32:
+                        # Not in our network, the gateway will route it
+                        dmac = gwmac
+                    if dmac is not None:
+                        frame = bytearray(packet.buf)
+                        frame[0:12] = dmac + self.iface_mac
+                        try:
+                            l2snd.send(frame)
+                        except socket.error:
+                            self.stats.forward_errors.inc()
+                            continue
+                        self.stats.forwarded.inc()
+                        continue
+
+                # Send the packet at layer 3 and let the kernel do the forwarding
+                try:
+                    snd.sendto(packet.l3, (packet.ip_dst, 0))
+                except socket.error:
+                    self.stats.forward_errors.inc()
+                    continue
+                self.stats.forwarded.inc()
+
+            self.stats.forward_time.observe((time.time() - start) / len(batch), len(batch))
+
+    @staticmethod
+    def neighbours():
+        """
+        Returns a dictionary that maps the IP addresses of the targets and the gateway (as integers)
+        to their MAC addresses (binary form)
+        """
+        table = {}
+        for t in ctx.targetlist:
+            if t.ip and t.mac and utils.is_ip(t.ip):
+                table[utils.aton(t.ip)] = utils.mton(t.mac)
+        table[utils.aton(ctx.gateway.ip)] = utils.mton(ctx.gateway.mac)
+        return table
 
     def decode_packets(self):
         """
@@ -196,19 +473,56 @@ class KoalaFilter(object):
         Takes the packets from to_decode queue and pass them to the decoder manager that
         will handle the parsing.
         """
-        while self.running:
+        while True:
+            batch = self.to_decode.get_batch(BATCH_SIZE)
+            start = time.time()
+            for packet in batch:
+                if packet is None:
+                    # No more packets to decode
+                    return
+
+                # Pass the packet to the decoder manager
+                try:
+                    self.decoder_manager.decode(packet)
+                except Exception:
+                    # A failing decoder must not stop the decoding of the next packets
+                    self.stats.decode_errors.inc()
+                    continue
+                self.stats.decoded.inc()
+            self.stats.decode_time.observe((time.time() - start) / len(batch), len(batch))
+
+    def process(self, batch):
+        """
+        Evaluates and decodes a batch of packets in the calling thread. Used when reading from
+        a file (there is nothing to forward), so the packets don't go through the queues and
+        the filter threads.
+        """
+        decode = self.decoder_manager.decode
+        stats = self.stats
+        start = time.time()
+        for packet in batch:
             try:
-                packet = self.to_decode.get(block=False, timeout=1)
-            except Queue.Empty:
+                if not self.evaluate(packet)[1]:
+                    continue
+            except Exception:
+                stats.errors.inc()
                 continue
+            try:
+                decode(packet)
+            except Exception:
+                stats.decode_errors.inc()
+                continue
+            stats.decoded.inc()
+        if batch:
+            stats.eval_time.observe((time.time() - start) / len(batch), len(batch))
+            self.flows.sweep(batch[-1].time)
 
-            if packet is None:
-                # No more packets to decode
-                break
-
-            # Pass the packet to the decoder manager
-            self.decoder_manager.decode(packet)
-            self.stats.decoded += 1
+    def set_decoding(self, enabled):
+        """
+        Starts or stops passing the packets to the decoders, the packets that aren't decoded
+        are counted as ignored
+        """
+        self.decoding.value = 1 if enabled else 0
 
     def start(self):
         """
@@ -217,8 +531,21 @@ class KoalaFilter(object):
         if not self.enabled or self.running:
             return
         self.running = True
+        if self.inline:
+            return # The sniffer thread does all the work
+        if self.workers:
+            # The master starts the filter before the other modules, so the workers are forked
+            # before their threads run. The UI and decoder threads that are already running
+            # are rebuilt in the workers (see TextUI.forward() and Decoder.forked())
+            for w in self.workers:
+                w.start()
+            self.relay.start()
+            self.eval_thread.run = self.dispatch_packets
+            self.eval_thread.start()
+            return
         self.eval_thread.start()
-        self.forward_thread.start()
+        if not self.from_file:
+            self.forward_thread.start()
         self.decode_thread.start()
 
     def stop(self):
@@ -228,28 +555,120 @@ class KoalaFilter(object):
         if not self.enabled or not self.running:
             return
         self.running = False
-        self.eval_thread.end()
-        self.forward_thread.end()
-        self.decode_thread.end()
+        if self.inline:
+            return
+        # The threads are blocked waiting for packets, wake them up with None. The evaluation
+        # thread will pass it on to the forwarding and decoding threads. None never waits for
+        # room in the queues and the joins time out, so a stuck thread can't hang the shutdown
+        self.sniffed_packets.put(None)
+        self.eval_thread.end(timeout=JOIN_TIMEOUT)
+        if self.workers:
+            for w in self.workers:
+                w.stop()
+            self.relay.end()
+            return
+        self.forward_thread.end(timeout=JOIN_TIMEOUT)
+        self.decode_thread.end(timeout=JOIN_TIMEOUT)
 
 
 class FilterStats(object):
+    """
+    Koala filter counters and stage latencies, kept in the metrics registry. When the filter
+    runs in worker processes, every worker publishes its SHARED counters in a row of the shards
+    array and the main process adds them up.
+    """
 
-    __slots__ = [ "total", "dropped", "forwarded",
-                  "decoded", "ignored" ]
+    __slots__ = [ "total", "dropped", "forwarded", "decoded", "ignored", "echoed", "errors",
+                  "forward_errors", "decode_errors", "eval_time", "forward_time", "decode_time",
+                  "queues", "capture", "shards", "kernel_echo" ]
+
+    SHARED = ("total", "dropped", "forwarded", "decoded", "ignored", "errors", "forward_errors",
+              "decode_errors")
 
     def __init__(self):
-        self.total = 0
-        self.dropped = 0
-        self.decoded = 0
-        self.forwarded = 0
-        self.ignored = 0
+        counter = metrics.registry.counter
+        self.total = counter("filter.total")
+        self.echoed = counter("sniff.echoed") # Our own frames, discarded by the sniffer
+        self.dropped = counter("filter.dropped")
+        self.decoded = counter("decode.packets")
+        self.forwarded = counter("forward.packets")
+        self.ignored = counter("filter.ignored")
+        # Packets that raised an exception while being evaluated or decoded, or that couldn't
+        # be sent
+        self.errors = counter("filter.errors")
+        self.forward_errors = counter("forward.errors")
+        self.decode_errors = counter("decode.errors")
+        # Processing time per packet of every stage
+        histogram = metrics.registry.histogram
+        self.eval_time = histogram("filter.latency")
+        self.forward_time = histogram("forward.latency")
+        self.decode_time = histogram("decode.latency")
+        # (name, BatchQueue) tuples whose overload drops are reported
+        self.queues = []
+        # Capture handle with kernel counters (TPacketRing), None if not available
+        self.capture = None
+        # Counters of the worker processes (multiprocessing.Array), None if there are no workers
+        self.shards = None
+        # Set when our own frames are discarded by the kernel instead of the sniffer
+        self.kernel_echo = False
+
+    def share(self, shards, shard=None):
+        """
+        Uses the array of counters of the worker processes. The main process (shard is None)
+        adds the rows of the workers to its counters, a worker publishes its counters in the
+        row of its shard.
+        """
+        self.shards = shards
+        n = len(self.SHARED)
+        for i, field in enumerate(self.SHARED):
+            remote = None
+            if shard is None:
+                remote = lambda i=i: sum(shards[i::n])
+            getattr(self, field).remote = remote
+
+    def histograms(self):
+        """
+        Returns the latency histograms of the filter stages
+        """
+        return self.eval_time, self.forward_time, self.decode_time
+
+    def echo_in_kernel(self):
+        """
+        Our own frames are discarded by the kernel, so the sniffer never sees them. They are
+        every frame we send, forwarded or injected, and counted as such.
+        """
+        self.kernel_echo = True
+        injected = metrics.registry.counter("inject.packets")
+        self.echoed.remote = lambda: self.forwarded.value() + injected.value()
+
+    def publish(self, shard):
+        """
+        Copies the SHARED counters to the row of shard in the shards array
+        """
+        row = shard * len(self.SHARED)
+        for i, field in enumerate(self.SHARED):
+            self.shards[row + i] = getattr(self, field).own()
 
     def get(self):
-        return "< Filter Stats | %s dropped | %s forwarded | %s decoded | %s ignored | Total: %s >"%(self.dropped,
-                                                                                                    self.forwarded,
-                                                                                                    self.decoded,
-                                                                                                    self.ignored,
-                                                                                                    self.total)
+        s = "< Filter Stats | %s dropped | %s forwarded | %s decoded | %s ignored | Total: %s"%(self.dropped.value(),
+                                                                                               self.forwarded.value(),
+                                                                                               self.decoded.value(),
+                                                                                               self.ignored.value(),
+                                                                                               self.total.value())
+        echoed = self.echoed.value()
+        if echoed:
+            s += " | %s echoed%s" %(echoed, " (discarded in kernel)" if self.kernel_echo else "")
+        errors = [(name, c.value()) for name, c in (("filter", self.errors),
+                                                    ("forward", self.forward_errors),
+                                                    ("decode", self.decode_errors))]
+        if any(n for name, n in errors):
+            s += " | Errors: %s" %", ".join("%s %s" %(name, n) for name, n in errors)
+        if self.capture is not None:
+            packets, drops, freezes = self.capture.stats()
+            s += " | Kernel: %s drops, %s freezes" %(drops, freezes)
+        if self.queues:
+            s += " | Queue drops: %s" %", ".join("%s %s (%s)" %(name, q.dropped, q.policy)
+                                                 for name, q in self.queues)
+        return s + " >"
     def __str__(self):
         return self.get()
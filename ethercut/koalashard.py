@@ -0,0 +1,263 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Koala filter worker processes: every worker evaluates, forwards and decodes the flows of
+one shard
+"""
+
+import time
+import signal
+import threading
+import Queue
+import multiprocessing
+import ethercut.net.frame as frame
+import ethercut.net.target as target
+import ethercut.types.ring as ring
+import ethercut.types.basethread as basethread
+import ethercut.types.batchqueue as batchqueue
+
+from ethercut.config import ethconf
+from ethercut.context import ctx
+
+# Seconds between stats publications of a worker
+PUBLISH_TIME = 0.5
+
+# Seconds to wait for a worker to exit
+JOIN_TIMEOUT = 5
+
+# Maximum seconds the dispatcher waits for room in a full ring, so a worker that doesn't read
+# its packets can't stop the dispatcher
+SEND_TIMEOUT = 1
+
+# Seconds to wait for the reports of the workers, and seconds a set of reports is reused
+REPORT_TIMEOUT = 1
+REPORT_TTL = 0.25
+
+# Maximum number of flows in the report of a worker
+REPORT_FLOWS = 100
+
+
+class ShardChannel(object):
+    """
+    Carries the packets of a shard from the dispatcher to its worker through a PacketRing in
+    shared memory. The target list goes through a separate control queue when it changes, so
+    the workers can forward to the new targets. The reports of the worker are requested
+    through the control queue too, and answered through a pipe.
+
+    The worker reads the channel with get_batch(), as if it were the sniffed packets queue.
+    The frames point into the ring, they must be detached before the next call if they are
+    kept.
+
+    A full ring is handled with the overload policy of the sniffed packets queue: block waits
+    for room, shed only waits for the priority packets and the drop policies discard the new
+    packets (only the worker can free slots, so drop-oldest behaves as drop-newest).
+
+    +param: size   - Size of the ring in bytes
+    +param: policy - Overload policy (a batchqueue policy)
+    """
+
+    __slots__ = [ "ring", "control", "policy", "replies", "reply_sink", "reporter" ]
+
+    def __init__(self, size, policy=batchqueue.DROP_NEWEST):
+        self.ring = ring.PacketRing(size)
+        self.control = multiprocessing.Queue()
+        self.replies, self.reply_sink = multiprocessing.Pipe(False)
+        # Function that builds the report of the worker, called with the number of flows
+        self.reporter = None
+        self.policy = policy
+        if policy in (batchqueue.BLOCK, batchqueue.SHED):
+            self.ring.policy = policy
+
+    def send(self, packets, priority=()):
+        """
+        Sends a list of packets and a list of priority packets (those that may have to be
+        forwarded), applying the overload policy when the ring is full
+        """
+        if priority:
+            block = self.policy in (batchqueue.BLOCK, batchqueue.SHED)
+            self.ring.put_batch([(p.time, p.buf) for p in priority], block, SEND_TIMEOUT)
+        if packets:
+            block = self.policy == batchqueue.BLOCK
+            self.ring.put_batch([(p.time, p.buf) for p in packets], block, SEND_TIMEOUT)
+
+    def send_targets(self, targets):
+        """
+        Sends the target list as (ip, mac) tuples
+        """
+        self.control.put(("targets", [(t.ip, t.mac) for t in targets]))
+
+    def request_report(self, seq, nflows):
+        """
+        Asks the worker for its report, with its nflows top flows
+        """
+        self.control.put(("report", (seq, nflows)))
+
+    def read_report(self, seq, timeout):
+        """
+        Returns the report answering the request seq, None if it doesn't come in timeout
+        seconds. The answers to older requests are discarded.
+        """
+        end = time.time() + timeout
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0 or not self.replies.poll(remaining):
+                return None
+            rseq, report = self.replies.recv()
+            if rseq == seq:
+                return report
+
+    def close(self):
+        """
+        Tells the worker there are no more packets
+        """
+        self.ring.close()
+
+    def get_batch(self, maxitems=256):
+        """
+        Returns the next batch of packets (RawFrame objects), [None] once the channel is
+        closed. The messages of the control queue are handled between batches.
+        """
+        while True:
+            self.poll_control()
+            batch = self.ring.read_batch(maxitems, ring.WAIT_TIME)
+            if batch is None:
+                return [None]
+            if batch:
+                return [frame.RawFrame(ts, buf) for ts, buf in batch]
+
+    def poll_control(self):
+        """
+        Rebuilds the target list of the worker with the last list sent and answers the last
+        report request
+        """
+        targets = request = None
+        try:
+            while True:
+                kind, data = self.control.get_nowait()
+                if kind == "targets":
+                    targets = data
+                else:
+                    request = data
+        except Queue.Empty:
+            pass
+        if targets is not None:
+            ctx.targetlist.clear()
+            for ip, mac in targets:
+                ctx.targetlist.append(target.Target(ip, mac))
+        if request is not None and self.reporter is not None:
+            seq, nflows = request
+            self.reply_sink.send((seq, self.reporter(nflows)))
+
+
+class ShardWorker(multiprocessing.Process):
+    """
+    Worker process of the koala filter. It is forked when the filter starts, so it gets the
+    configured filter, decoders and context; it runs the filter pipeline on the packets of its
+    shard and publishes its counters in the shared stats.
+
+    +param: koala   - Configured KoalaFilter
+    +param: shard   - Number of the shard
+    +param: ui_sink - Queue where the messages printed by the worker are sent
+    """
+
+    def __init__(self, koala, shard, ui_sink):
+        super(ShardWorker, self).__init__(name="Koala shard %d" %shard)
+        self.daemon = True
+        self.koala = koala
+        self.shard = shard
+        self.ui_sink = ui_sink
+        self.channel = ShardChannel(ethconf.shard_ring_size, ethconf.sniff_queue_policy)
+
+    def run(self):
+        # The main process stops the workers through their channels
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        ctx.ui.forward(self.ui_sink)
+        for d in self.koala.decoder_manager:
+            d.forked()
+        try:
+            self.koala.run_shard(self.shard, self.channel, PUBLISH_TIME)
+        finally:
+            ctx.ui.render.end()
+            ctx.ui.forward_frame(self.ui_sink)
+
+    def stop(self):
+        """
+        Waits for the worker to process the packets sent so far and exit
+        """
+        self.join(JOIN_TIMEOUT)
+        if self.is_alive():
+            self.terminate()
+
+
+class ShardReports(object):
+    """
+    Gets the state that only lives in the workers (their flow tables, decoder counters and
+    latency histograms) for the main process. The reports are requested when they are read
+    and reused for REPORT_TTL seconds, so reading several metrics asks the workers once. A
+    worker that doesn't answer in REPORT_TIMEOUT seconds is left out.
+
+    +param: workers - ShardWorker list
+    """
+
+    __slots__ = [ "workers", "lock", "seq", "reports", "time", "nflows" ]
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.reports = []
+        self.time = 0
+        self.nflows = 0
+
+    def get(self, nflows=0):
+        """
+        Returns the reports of the workers, with up to nflows top flows each (REPORT_FLOWS
+        at most)
+        """
+        nflows = min(nflows, REPORT_FLOWS)
+        with self.lock:
+            if time.time() - self.time < REPORT_TTL and nflows <= self.nflows:
+                return self.reports
+            self.seq += 1
+            for w in self.workers:
+                w.channel.request_report(self.seq, nflows)
+            end = time.time() + REPORT_TIMEOUT
+            reports = []
+            for w in self.workers:
+                report = w.channel.read_report(self.seq, end - time.time())
+                if report is not None:
+                    reports.append(report)
+            self.reports = reports
+            self.time = time.time()
+            self.nflows = nflows
+            return reports
+
+
+class UIRelay(basethread.BaseThread):
+    """
+    Prints the messages sent by the workers
+    """
+
+    def __init__(self):
+        super(UIRelay, self).__init__("Shard UI relay")
+        self.sink = multiprocessing.Queue()
+
+    def run(self):
+        while True:
+            msgs = self.sink.get()
+            if msgs is None:
+                return
+            ctx.ui.queue.put_batch(msgs)
+
+    def end(self, join=True):
+        if not self.running:
+            return
+        self.sink.put(None)
+        super(UIRelay, self).end(join)
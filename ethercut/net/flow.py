@@ -0,0 +1,134 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Connection tracking: flow table used by the koala filter to cache its verdicts
+"""
+
+import heapq
+
+
+def flow_shard(packet, n):
+    """
+    Returns the shard (0 to n-1) of the flow of a packet. The hash is symmetric, both
+    directions of a connection go to the same shard. Frames without an IP datagram go to
+    shard 0 and the IP fragments without transport header are hashed by their addresses only.
+    """
+    saddr = packet.saddr
+    if saddr is None:
+        return 0
+    h = saddr ^ packet.daddr ^ packet.proto
+    sport = packet.sport
+    if sport is not None:
+        h ^= (sport ^ packet.dport) << 16
+    # Fibonacci hashing, the high bits are the well mixed ones
+    return (((h * 2654435761) & 0xffffffff) >> 16) % n
+
+
+class Flow(object):
+    """
+    A unidirectional 5-tuple flow and the filter verdict for its packets.
+
+    +param: forward   - True if the packets of this flow must be forwarded
+    +param: direction - Direction of the flow (see target.TargetMatcher)
+    +param: ts        - Timestamp of the first packet
+    """
+
+    __slots__ = [ "forward", "decode", "direction", "packets", "bytes", "first", "last" ]
+
+    def __init__(self, forward, direction, ts):
+        self.forward = forward
+        self.decode = bool(direction)
+        self.direction = direction
+        self.packets = 0
+        self.bytes = 0
+        self.first = ts
+        self.last = ts
+
+
+class FlowTable(object):
+    """
+    Table of flows keyed by (proto, src ip, dst ip, src port, dst port).
+
+    Flows that don't see any packet for timeout seconds are expired. When the table is full,
+    the least recently used flows are evicted to make room for the new ones.
+
+    +param: maxflows - Maximum number of flows in the table
+    +param: timeout  - Idle time (in seconds) after which a flow expires
+    """
+
+    __slots__ = [ "flows", "maxflows", "timeout", "last_sweep", "expired", "evicted" ]
+
+    def __init__(self, maxflows=65536, timeout=60):
+        self.flows = {}
+        self.maxflows = maxflows
+        self.timeout = timeout
+        self.last_sweep = 0
+        # Statistics
+        self.expired = 0
+        self.evicted = 0
+
+    def lookup(self, key, ts):
+        """
+        Returns the flow identified by key (None if it isn't in the table or has expired)
+        """
+        flow = self.flows.get(key)
+        if flow is not None and ts - flow.last > self.timeout:
+            del self.flows[key]
+            self.expired += 1
+            return None
+        return flow
+
+    def add(self, key, forward, direction, ts):
+        """
+        Adds a new flow to the table and returns it
+        """
+        if len(self.flows) >= self.maxflows:
+            self.evict(ts)
+        flow = self.flows[key] = Flow(forward, direction, ts)
+        return flow
+
+    def sweep(self, ts):
+        """
+        Removes the expired flows. It only walks the table every timeout/2 seconds, so it can
+        be called as often as needed.
+        """
+        if ts - self.last_sweep < self.timeout / 2.0:
+            return
+        self.last_sweep = ts
+        idle = [k for k, f in self.flows.iteritems() if ts - f.last > self.timeout]
+        for k in idle:
+            del self.flows[k]
+        self.expired += len(idle)
+
+    def evict(self, ts):
+        """
+        Makes room in the table: removes the expired flows and, if that's not enough, the
+        least recently used eighth of the table
+        """
+        self.last_sweep = 0
+        self.sweep(ts)
+        if len(self.flows) < self.maxflows:
+            return
+        n = max(1, self.maxflows >> 3)
+        lru = heapq.nsmallest(n, self.flows.iteritems(), key=lambda x: x[1].last)
+        for k, f in lru:
+            del self.flows[k]
+        self.evicted += len(lru)
+
+    def top(self, n=10):
+        """
+        Returns a list with the n flows that have moved more bytes as (key, flow) tuples
+        """
+        return heapq.nlargest(n, self.flows.items(), key=lambda x: x[1].bytes)
+
+    def clear(self):
+        self.flows = {}
+
+    def __len__(self):
+        return len(self.flows)
@@ -0,0 +1,279 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Raw frames: captured packets that are dissected lazily
+"""
+
+import socket
+import struct
+import ethercut.utils as utils
+import scapy.layers.l2 as l2
+
+# Ethernet
+ETH_HLEN     = 14
+ETH_P_IP     = 0x0800
+ETH_P_ARP    = 0x0806
+ETH_P_8021Q  = 0x8100
+ETH_P_8021AD = 0x88a8
+
+# IPv4
+IP_HLEN      = 20
+IPPROTO_TCP  = 6
+IPPROTO_UDP  = 17
+
+# ARP
+ARP_REQUEST  = 1
+ARP_REPLY    = 2
+ETH_BROADCAST = "ff:ff:ff:ff:ff:ff"
+ETH_ZERO      = "00:00:00:00:00:00"
+
+_unpack_from = struct.unpack_from
+_ETH_ARP = struct.Struct("!6s6sHHHBBH6s4s6s4s")
+_ARP_FIELDS = struct.Struct("!12xH6xH6sI6sI")
+
+
+class RawFrame(object):
+    """
+    A frame as it was captured. Only the raw buffer and the timestamp are stored, the Ethernet,
+    IPv4 and TCP/UDP headers are parsed with struct the first time one of their fields is
+    accessed.
+
+    The Scapy packet is built on demand: any attribute that this class doesn't know about
+    (e.g. packet.payload) is looked up in the dissected packet, so decoders can keep using the
+    frame as if it were a Scapy packet.
+
+    +param: ts  - Capture timestamp
+    +param: buf - Captured bytes (str or buffer)
+    """
+
+    __slots__ = [ "time", "buf", "_parsed", "_l3", "_l4", "_proto", "_saddr", "_daddr",
+                  "_sport", "_dport", "_packet" ]
+
+    def __init__(self, ts, buf):
+        self.time = ts
+        self.buf = buf
+        self._parsed = False
+        self._packet = None
+
+    def _parse(self):
+        """
+        Parse the header offsets and the fields needed by the koala filter
+        """
+        self._parsed = True
+        self._l3 = self._l4 = self._proto = None
+        self._saddr = self._daddr = self._sport = self._dport = None
+
+        buf = self.buf
+        ln = len(buf)
+        if ln < ETH_HLEN:
+            return
+
+        # Skip VLAN tags
+        off = 12
+        etype, = _unpack_from("!H", buf, off)
+        while (etype == ETH_P_8021Q or etype == ETH_P_8021AD) and ln >= off + 6:
+            off += 4
+            etype, = _unpack_from("!H", buf, off)
+        off += 2
+
+        if etype != ETH_P_IP or ln < off + IP_HLEN:
+            return
+
+        vihl, frag, proto, saddr, daddr = _unpack_from("!B5xHxB2xII", buf, off)
+        if vihl >> 4 != 4:
+            return
+        self._l3 = off
+        self._proto = proto
+        self._saddr = saddr
+        self._daddr = daddr
+
+        # Only the first fragment carries the transport header
+        off += (vihl & 0x0f) << 2
+        if frag & 0x1fff == 0 and (proto == IPPROTO_TCP or proto == IPPROTO_UDP) and ln >= off + 4:
+            self._l4 = off
+            self._sport, self._dport = _unpack_from("!HH", buf, off)
+
+    ##################
+    ##  Ethernet    ##
+    ##################
+
+    @property
+    def eth_dst(self):
+        """
+        Destination MAC address (6 bytes binary form)
+        """
+        return self.buf[0:6]
+
+    @property
+    def eth_src(self):
+        """
+        Source MAC address (6 bytes binary form)
+        """
+        return self.buf[6:12]
+
+    @property
+    def dst(self):
+        """
+        Destination MAC address
+        """
+        return utils.ntom(self.buf[0:6])
+
+    @property
+    def src(self):
+        """
+        Source MAC address
+        """
+        return utils.ntom(self.buf[6:12])
+
+    ##############
+    ##  IPv4    ##
+    ##############
+
+    @property
+    def proto(self):
+        """
+        IP protocol number (None if this is not an IPv4 datagram)
+        """
+        if not self._parsed:
+            self._parse()
+        return self._proto
+
+    @property
+    def saddr(self):
+        """
+        Source IP address as an integer (None if this is not an IPv4 datagram)
+        """
+        if not self._parsed:
+            self._parse()
+        return self._saddr
+
+    @property
+    def daddr(self):
+        """
+        Destination IP address as an integer (None if this is not an IPv4 datagram)
+        """
+        if not self._parsed:
+            self._parse()
+        return self._daddr
+
+    @property
+    def ip_src(self):
+        """
+        Source IP address in dotted form
+        """
+        saddr = self.saddr
+        return None if saddr is None else utils.ntoa(saddr)
+
+    @property
+    def ip_dst(self):
+        """
+        Destination IP address in dotted form
+        """
+        daddr = self.daddr
+        return None if daddr is None else utils.ntoa(daddr)
+
+    @property
+    def l3(self):
+        """
+        Returns the raw IP datagram (None if this is not an IPv4 datagram)
+        """
+        if not self._parsed:
+            self._parse()
+        return None if self._l3 is None else self.buf[self._l3:]
+
+    ###############
+    ##  TCP/UDP  ##
+    ###############
+
+    @property
+    def sport(self):
+        """
+        TCP/UDP source port (None if there is no TCP/UDP segment)
+        """
+        if not self._parsed:
+            self._parse()
+        return self._sport
+
+    @property
+    def dport(self):
+        """
+        TCP/UDP destination port (None if there is no TCP/UDP segment)
+        """
+        if not self._parsed:
+            self._parse()
+        return self._dport
+
+    ####################
+    ##  Scapy packet  ##
+    ####################
+
+    @property
+    def packet(self):
+        """
+        Returns the dissected Scapy packet, it is built the first time it is requested
+        """
+        if self._packet is None:
+            self._packet = l2.Ether(str(self.buf))
+            self._packet.time = self.time
+        return self._packet
+
+    def __getattr__(self, attr):
+        # Only called when attr is not one of our fields, fall back to the Scapy packet
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.packet, attr)
+
+    def detach(self):
+        """
+        Copies the bytes of the frame when buf points into memory that is going to be reused
+        (a ring shared with another process)
+        """
+        if not isinstance(self.buf, str):
+            self.buf = str(self.buf)
+
+    def __str__(self):
+        return str(self.buf)
+
+    def __len__(self):
+        return len(self.buf)
+
+
+######################
+##  Frame builders  ##
+######################
+
+def arp_frame(op, hwsrc, psrc, hwdst, pdst, ethdst=None):
+    """
+    Builds a raw Ethernet/ARP frame (ready to be sent with the injector).
+    The ethernet source address is hwsrc and the destination ethdst (hwdst if ethdst is None).
+
+    +param: op    - ARP_REQUEST or ARP_REPLY
+    +param: hwsrc - Sender MAC address
+    +param: psrc  - Sender IP address
+    +param: hwdst - Target MAC address
+    +param: pdst  - Target IP address
+    """
+    return _ETH_ARP.pack(utils.mton(ethdst or hwdst), utils.mton(hwsrc), ETH_P_ARP,
+                         1, ETH_P_IP, 6, 4, op,
+                         utils.mton(hwsrc), socket.inet_aton(psrc),
+                         utils.mton(hwdst), socket.inet_aton(pdst))
+
+
+def parse_arp(buf):
+    """
+    Parses a raw Ethernet/ARP frame. Returns a tuple (op, hwsrc, psrc, hwdst, pdst) with the
+    MAC addresses in binary form and the IP addresses as integers, or None if buf is not an ARP
+    message.
+    """
+    if len(buf) < _ETH_ARP.size:
+        return None
+    etype, op, hwsrc, psrc, hwdst, pdst = _ARP_FIELDS.unpack_from(buf)
+    if etype != ETH_P_ARP:
+        return None
+    return op, hwsrc, psrc, hwdst, pdst
@@ -11,9 +11,13 @@ Packet injection
 """
 
 import time
-import pcap
-import Queue
+import socket
+import ethercut.metrics as metrics
+import ethercut.exceptions as exceptions
+import ethercut.net.rawsock as rawsock
 import ethercut.types.basethread as basethread
+import ethercut.types.batchqueue as batchqueue
+import ethercut.types.tokenbucket as tokenbucket
 
 from ethercut.context import ctx
 from ethercut.config import ethconf
@@ -27,36 +31,49 @@ from ethercut.types.colorstr import CStr
 class _InjectorWorker(basethread.BaseThread):
     """
     This worker is responsible of writing packets from the queue to the wire.
+    Every worker has its own socket, so the workers don't have to wait for each other.
 
-    +param: pktq   - Queue object representing the packet queue
-    +param: stream - Injecting stream
-    +param: ts     - Delay time between packets
+    +param: pktq   - BatchQueue object representing the packet queue
+    +param: sock   - L2Socket the packets are sent through, it is closed when the worker exits
+    +param: bucket - TokenBucket shared by all the workers to limit the injection rate
+    +param: batch  - Maximum number of packets taken from the queue at once
     """
 
-    def __init__(self, pktq, stream, ts=0.0, name="Injector worker"):
+    def __init__(self, pktq, sock, bucket, batch=64, name="Injector worker"):
         super(_InjectorWorker, self).__init__(name)
         self.queue = pktq
-        self.stream= stream
-        self.delay = ts
-
-    def inject(self, pkt):
-        """
-        Use the pcap stream to send the packet
-        """
-        self.lock.acquire()
-        self.stream.sendpacket(str(pkt))
-        self.lock.release()
+        self.sock  = sock
+        self.bucket= bucket
+        self.batch = batch
+        self.sent = metrics.registry.counter("inject.packets")
+        self.errors = metrics.registry.counter("inject.errors")
+        self.latency = metrics.registry.histogram("inject.latency")
 
     def run(self):
         """
         Injection logic
         """
-        while self.running:
-            packet = self.queue.get()
-            if packet is None: # Terminate activity when None is received
-                break
-            self.inject(packet)
-            time.sleep(self.delay)
+        sock = self.sock
+        try:
+            while True:
+                packets = self.queue.get_batch(self.batch)
+                stop = packets.count(None)
+                if stop: # Terminate activity when None is received
+                    if stop > 1: # Leave the rest for the other workers
+                        self.queue.put_batch([None]*(stop-1))
+                    packets = [p for p in packets if p is not None]
+                self.bucket.consume(len(packets))
+                # Packets can be pushed as Scapy packets or as raw frames
+                start = time.time()
+                failed = sock.send_batch(map(str, packets))
+                if packets:
+                    self.latency.observe((time.time() - start) / len(packets), len(packets))
+                    self.sent.inc(len(packets) - failed)
+                    self.errors.inc(failed)
+                if stop:
+                    break
+        finally:
+            sock.close()
 
 
 #######################
@@ -68,22 +85,35 @@ class Injector(object):
     Packet injector. Spawns a number of workers to inject the packets on the queue
     """
 
-    __slots__ = [ "queue", "workers", "running", "enabled" ]
+    __slots__ = [ "queue", "workers", "running", "enabled", "bucket" ]
 
     def __init__(self):
-        self.queue = Queue.Queue()
+        self.queue = batchqueue.BatchQueue()
         self.running = False
         self.workers = []
         self.enabled = False
+        self.bucket = tokenbucket.TokenBucket(0)
         ctx.injector = self
 
     def configure(self):
-        # Configure the pcap stream for the workers
         self.enabled = True
-        pcp = pcap.pcap(ctx.iface.name, 65535, False, 1)
-        self.workers = [_InjectorWorker(self.queue, pcp, ethconf.inject_timeout, name="Injector worker %d")
-                        for n in xrange(1, ethconf.inject_workers)]
-        ctx.ui.msg("[%s] Workers: %s | Delay: %sms" %(CStr("INJECTOR").cyan, ethconf.inject_workers, ethconf.inject_timeout))
+        self.bucket.set_rate(ethconf.inject_rate)
+        try:
+            self.queue.set_limits(ethconf.inject_queue_size, ethconf.inject_queue_policy)
+        except ValueError as e:
+            raise exceptions.EthercutException(str(e))
+        # Open the sockets now, so a failure stops the program before the attack starts
+        try:
+            socks = [rawsock.L2Socket(ctx.iface.name) for n in xrange(ethconf.inject_workers)]
+        except (socket.error, OSError) as e:
+            raise exceptions.EthercutException("Couldn't open the injection sockets on %s: %s"
+                                               %(ctx.iface.name, e))
+        self.workers = [_InjectorWorker(self.queue, sock, self.bucket, ethconf.inject_batch,
+                                        name="Injector worker %d" %n)
+                        for n, sock in enumerate(socks)]
+        metrics.registry.gauge("queue.inject", self.queue.qsize)
+        rate = "%s pps" %ethconf.inject_rate if ethconf.inject_rate else "unlimited"
+        ctx.ui.msg("[%s] Workers: %s | Rate: %s" %(CStr("INJECTOR").cyan, ethconf.inject_workers, rate))
 
     def start(self):
         """
@@ -116,6 +146,13 @@ class Injector(object):
         if self.running and self.enabled:
             self.queue.put(pkt, block, timeout)
 
+    def push_batch(self, pkts):
+        """
+        Push a list of packets into the queue
+        """
+        if self.running and self.enabled:
+            self.queue.put_batch(pkts)
+
     def __nonzero__(self):
         """
         Returns True if the injector is running, False otherwise
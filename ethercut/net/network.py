@@ -11,7 +11,6 @@ Class that provides access to various network parameters
 """
 
 import ethercut.utils as utils
-import ethercut.shell as shell
 
 
 class Network(object):
@@ -60,6 +59,15 @@ class Network(object):
             ret.append(utils.ntoa(self.net32 | i))
         return ret
 
+    @property
+    def host_range(self):
+        """
+        Returns the first and last host addresses of this network as integers (network and
+        broadcast addresses excluded).
+        """
+        nhost = (0xffffffff ^ self.mask32)
+        return self.net32 | 1, self.net32 | (nhost - 1)
+
     @property
     def broadcast(self):
         """
@@ -72,14 +80,7 @@ class Network(object):
         """
         Returns the network gateway, None if not found.
         """
-        # Execute netstat to get the routing table
-        netst = shell.Shell().netstat("-nr")[0]
-        netst = netst[2:].split("\n")
-        for l in netst:
-            # Look for a valid Route "U", and a gateway "G"
-            if "UG" in l:
-                return l.split()[1]
-        return None
+        return utils.get_gateway()
 
     @property
     def prefix_len(self):
@@ -0,0 +1,111 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Offline capture reader: walks a pcap file mapped in memory
+"""
+
+import mmap
+import struct
+import ethercut.exceptions as exceptions
+
+# Magic numbers (microsecond and nanosecond timestamps)
+PCAP_MAGIC    = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+
+
+class PcapFile(object):
+    """
+    Reads the records of a classic pcap file (pcapng is not supported). The file is mapped in
+    memory and the record headers are parsed with struct, the packets are returned as buffers
+    into the mapping, so nothing is copied.
+
+    The buffers are valid until close() is called.
+
+    +param: path - Path of the pcap file
+    """
+
+    __slots__ = [ "path", "file", "map", "offset", "record", "scale", "linktype", "snaplen" ]
+
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        try:
+            self.file = open(path, "rb")
+        except (IOError, EnvironmentError) as e:
+            raise exceptions.EthercutException("Couldn't read %s: %s" %(path, e))
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError) as e:
+            # e.g. an empty file can't be mapped
+            self.close()
+            raise exceptions.EthercutException("Couldn't read %s: %s" %(path, e))
+
+        if len(self.map) < 24:
+            self.close()
+            raise exceptions.EthercutException("%s is not a pcap file" %path)
+
+        for order in ("<", ">"):
+            magic, = struct.unpack_from(order+"I", self.map, 0)
+            if magic in (PCAP_MAGIC, PCAP_MAGIC_NS):
+                break
+        else:
+            self.close()
+            raise exceptions.EthercutException("%s is not a pcap file" %path)
+
+        self.scale = 1e-6 if magic == PCAP_MAGIC else 1e-9
+        self.snaplen, self.linktype = struct.unpack_from(order+"16xII", self.map, 0)
+        self.record = struct.Struct(order+"IIII")
+        self.offset = 24
+
+    @staticmethod
+    def is_pcap(path):
+        """
+        Returns True if path is a classic pcap file
+        """
+        try:
+            with open(path, "rb") as f:
+                head = f.read(4)
+        except IOError:
+            return False
+        if len(head) < 4:
+            return False
+        return (struct.unpack("<I", head)[0] in (PCAP_MAGIC, PCAP_MAGIC_NS) or
+                struct.unpack(">I", head)[0] in (PCAP_MAGIC, PCAP_MAGIC_NS))
+
+    def datalink(self):
+        return self.linktype
+
+    def read_batch(self, maxitems):
+        """
+        Returns a list with up to maxitems (timestamp, buffer) tuples, an empty list when the
+        end of the file is reached. A truncated last record is ignored.
+        """
+        m = self.map
+        end = len(m)
+        off = self.offset
+        unpack = self.record.unpack_from
+        scale = self.scale
+        hlen = self.record.size
+        ret = []
+        while len(ret) < maxitems and off + hlen <= end:
+            sec, frac, caplen, ln = unpack(m, off)
+            off += hlen
+            if off + caplen > end:
+                off = end
+                break
+            ret.append((sec + frac * scale, buffer(m, off, caplen)))
+            off += caplen
+        self.offset = off
+        return ret
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
@@ -0,0 +1,55 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Layer 2 socket: sends raw frames through a network interface
+"""
+
+import socket
+import ethercut.const as const
+
+
+class L2Socket(object):
+    """
+    Sends already built frames (str, buffer or bytearray) on an interface, no Scapy involved.
+    Uses an AF_PACKET socket on Linux and a pcap handle on other systems.
+
+    +param: iface - Name of the network interface
+    """
+
+    __slots__ = [ "iface", "sock", "send" ]
+
+    def __init__(self, iface):
+        self.iface = iface
+        if const.LINUX:
+            self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            self.sock.bind((iface, 0))
+            self.send = self.sock.send
+        else:
+            import pcap
+            self.sock = pcap.pcap(iface, 65535, False, 1)
+            self.send = lambda frame: self.sock.sendpacket(str(frame))
+
+    def send_batch(self, frames):
+        """
+        Sends a list of frames. A frame that can't be sent (e.g. ENOBUFS) doesn't stop the
+        rest, returns the number of frames that failed.
+        """
+        send = self.send
+        failed = 0
+        for f in frames:
+            try:
+                send(f)
+            except (socket.error, OSError):
+                failed += 1
+        return failed
+
+    def close(self):
+        if const.LINUX:
+            self.sock.close()
+        self.sock = None
@@ -13,6 +13,7 @@ Target: Represents an endpoint device on the network
 import time
 import ethercut.utils as utils
 import ethercut.exceptions as exceptions
+import ethercut.types.rangeset as rangeset
 
 from ethercut.types.colorstr import CStr
 
@@ -120,13 +121,15 @@ class Target(object):
 
 class TargetList(object):
     """
-    List of targets
+    List of targets. The version counter is increased every time a target is added or removed,
+    so users can tell when their copies of the list are outdated.
     """
 
     def __init__(self, targ=[]):
         if not isinstance(targ, list):
             targ = [targ]
         self.targets = {}
+        self.version = 0
         for t in targ:
             if t.mac not in self.targets:
                 self.targets[t.mac] = t
@@ -143,6 +146,7 @@ class TargetList(object):
         """
         if targ.mac not in self.targets:
             self.targets[targ.mac] = targ
+            self.version += 1
 
     def get(self, targ):
         """
@@ -161,6 +165,8 @@ class TargetList(object):
         for t in self.targets.values():
             if not t.is_alive():
                 lost.append(self.targets.pop(t.mac))
+        if lost:
+            self.version += 1
         return lost
 
     def get_byip(self, ip):
@@ -188,15 +194,18 @@ class TargetList(object):
         Removes a target from the list and returns it. Returns None if the target wasn't found.
         """
         try:
-            return self.targets.pop(targ.mac)
+            t = self.targets.pop(targ.mac)
         except KeyError:
             return None
+        self.version += 1
+        return t
 
     def clear(self):
         """
         Removes every target from the list
         """
         self.targets = {}
+        self.version += 1
 
     def __iter__(self):
         return iter(self.targets.values())
@@ -231,18 +240,35 @@ class TargetList(object):
     def __len__(self):
         return len(self.targets)
 
+def _mton(mac):
+    """
+    Converts a MAC address given by the user to its binary form
+    """
+    try:
+        return utils.mton(mac)
+    except ValueError:
+        raise exceptions.EthercutException("Invalid MAC address: %s" %mac)
+
+# Directions returned by TargetMatcher.match()
+DIR_NONE = 0 # The packet doesn't match the TARGETs
+DIR_1TO2 = 1 # From TARGET1 to TARGET2
+DIR_2TO1 = 2 # From TARGET2 to TARGET1
+
+
 class TargetSpec(object):
     """
     Target specifications: this class holds all the information required for scanning and attacking
     the hosts.
 
     Specific target-port bindings must be done manually by assigning a key (ip or mac) to the member
-    "specific" and a value (port)
+    "specific" and a value (port). Call compile() after changing them.
 
     +param: s - "IP/MAC/PORT" string
     """
 
-    __slots__ = [ "all", "ip", "mac", "port", "specific" ]
+    __slots__ = [ "all", "ip", "mac", "port", "specific",
+                  # Compiled specifications
+                  "_ips", "_macs", "_specific" ]
 
     def __init__(self, s=""):
         self.all  = False # All IP, MAC and ports
@@ -250,6 +276,9 @@ class TargetSpec(object):
         self.mac  = None # None means "No specific ip" (all ip)
         self.ip   = None # None means "No specific mac" (all mac)
         self.specific = {} # Specific target-port binds
+        self._ips = None
+        self._macs = None
+        self._specific = {}
         if s:
             self.compile_spec(s)
 
@@ -268,35 +297,52 @@ class TargetSpec(object):
         self.ip   = utils.expand_ip(ip)
         self.mac  = utils.expand_mac(mac)
 
-    def check(self, host):
+        # Sets used to match the packets: IPs as integer intervals and MACs in binary form
+        if self.ip is not None:
+            self._ips = rangeset.IntRangeSet((x, x) for x in map(utils.aton, self.ip))
+        if self.mac is not None:
+            self._macs = frozenset(map(_mton, self.mac))
+
+    def compile(self):
         """
-        Checks if a host (ip, mac, port) compiles this specifications
+        Resolves the specific target-port bindings so they can be looked up with the same
+        address forms used by accepts()
         """
-        if self.specific: # If there are specific bindings
+        self._specific = {}
+        for k, ports in self.specific.iteritems():
+            if utils.is_ip(k):
+                self._specific[utils.aton(k)] = ports
+            elif utils.is_mac(k):
+                self._specific[_mton(k)] = ports
 
-            if host[0] in self.specific: # Check if ip is in specific
-                if host[2] in self.specific[host[0]]:
-                    return True
-                else:
-                    #print "rejected %s %s %s" %(host[0], host[1], host[2])
-                    return False
+    def accepts(self, ip, mac, port):
+        """
+        Checks if a host complies this specifications.
 
-            elif host[1] in self.specific: # Check if mac is in specific
-                if host[2] in self.specific[host[1]]:
-                    return True
-                else:
-                    return False
+        +param: ip   - IP address as an integer
+        +param: mac  - MAC address in binary form
+        +param: port - TCP/UDP port
+        """
+        if self._specific: # If there are specific bindings
+            ports = self._specific.get(ip)
+            if ports is None:
+                ports = self._specific.get(mac)
+            if ports is not None:
+                return port in ports
 
         if self.all:
             return True
 
-        elif ((self.ip is None or host[0] in self.ip) and
-            (self.mac is None or host[1] in self.mac) and
-            (self.port is None or host[2] in self.port)):
-            return True
+        return ((self._ips is None or ip in self._ips) and
+                (self._macs is None or mac in self._macs) and
+                (self.port is None or port in self.port))
 
-        else:
-            return False
+    def check(self, host):
+        """
+        Checks if a host (ip, mac, port) compiles this specifications
+        """
+        ip, mac, port = host
+        return self.accepts(utils.aton(ip), _mton(mac), port)
 
     def __contains__(self, other):
         """
@@ -305,9 +351,42 @@ class TargetSpec(object):
         if self.all:
             return True
         if utils.is_ip(other):
-            if self.ip is None or other in self.ip:
+            if self._ips is None or utils.aton(other) in self._ips:
                 return True
         elif utils.is_mac(other):
-            if self.mac is None or other in self.mac:
+            if self._macs is None or _mton(other) in self._macs:
                 return True
         return False
+
+
+class TargetMatcher(object):
+    """
+    TARGET1 and TARGET2 compiled together to check the packets in both directions.
+    Addresses must be given in the same form as the RawFrame fields (integer IPs and binary MACs).
+
+    +param: target1 - TARGET1 specifications
+    +param: target2 - TARGET2 specifications
+    """
+
+    __slots__ = [ "target1", "target2" ]
+
+    def __init__(self, target1, target2):
+        self.target1 = target1
+        self.target2 = target2
+        target1.compile()
+        target2.compile()
+
+    def match(self, src_ip, src_mac, sport, dst_ip, dst_mac, dport):
+        """
+        Returns the direction of the packet (DIR_1TO2, DIR_2TO1 or DIR_NONE if it doesn't
+        match the TARGETs)
+        """
+        t1 = self.target1
+        t2 = self.target2
+        # Check from TARGET1 to TARGET2
+        if t1.accepts(src_ip, src_mac, sport) and t2.accepts(dst_ip, dst_mac, dport):
+            return DIR_1TO2
+        # Check from TARGET2 to TARGET1
+        if t2.accepts(src_ip, src_mac, sport) and t1.accepts(dst_ip, dst_mac, dport):
+            return DIR_2TO1
+        return DIR_NONE
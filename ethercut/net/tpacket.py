@@ -0,0 +1,195 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Linux AF_PACKET TPACKET_V3 capture: the kernel writes the frames in a ring of blocks shared
+with us through mmap
+"""
+
+import mmap
+import select
+import socket
+import struct
+import ctypes, ctypes.util
+import ethercut.exceptions as exceptions
+import ethercut.platform.linux as linux
+
+ETH_P_ALL = 0x0003
+
+SOL_PACKET            = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_RX_RING        = 5
+PACKET_STATISTICS     = 6
+PACKET_VERSION        = 10
+PACKET_MR_PROMISC     = 1
+SO_ATTACH_FILTER      = 26
+
+TPACKET_V3 = 2
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER   = 1
+
+# sll_pkttype of the frames we send
+PACKET_OUTGOING = 4
+
+DLT_EN10MB = 1
+PCAP_NETMASK_UNKNOWN = 0xffffffff
+
+# struct tpacket_req3
+_REQ3 = struct.Struct("=IIIIIII")
+# struct tpacket_block_desc: block_status, num_pkts, offset_to_first_pkt (after version and
+# offset_to_priv)
+_BLOCK = struct.Struct("=8xIII")
+_STATUS = struct.Struct("=I")
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac
+_HDR = struct.Struct("=IIIIIIH")
+# The struct sockaddr_ll follows the (aligned) tpacket3_hdr, sll_pkttype is at offset 10
+_PKTTYPE_OFF = 48 + 10
+# struct tpacket_stats_v3
+_STATS = struct.Struct("=III")
+# struct packet_mreq
+_MREQ = struct.Struct("=iHH8s")
+
+
+class _BpfProgram(ctypes.Structure):
+    _fields_ = [ ("bf_len", ctypes.c_uint), ("bf_insns", ctypes.c_void_p) ]
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [ ("len", ctypes.c_ushort), ("filter", ctypes.c_void_p) ]
+
+
+class TPacketRing(object):
+    """
+    Captures the frames of an interface through a TPACKET_V3 receive ring. The kernel fills
+    whole blocks of frames and we walk them without a system call per frame.
+
+    +param: iface      - Name of the network interface
+    +param: snaplen    - Maximum bytes captured of every frame
+    +param: promisc    - Put the interface in promiscuous mode
+    +param: block_size - Size of every block of the ring in bytes (multiple of the page size)
+    +param: block_nr   - Number of blocks of the ring
+    +param: timeout    - Milliseconds after which the kernel hands a block that isn't full
+    """
+
+    __slots__ = [ "iface", "snaplen", "sock", "ring", "poller", "block", "block_size", "block_nr",
+                  "packets", "drops", "freezes" ]
+
+    def __init__(self, iface, snaplen=65535, promisc=True, block_size=1 << 20, block_nr=64,
+                 timeout=64):
+        self.iface = iface
+        self.snaplen = snaplen
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.block = 0
+        # Kernel counters (accumulated, the kernel resets them on every read)
+        self.packets = 0
+        self.drops = 0
+        self.freezes = 0
+
+        # Frames must fit in a block, the kernel only uses frame_size to validate the request
+        frame_size = 1 << 11
+        while frame_size < snaplen + 128 and frame_size < block_size:
+            frame_size <<= 1
+
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            req = _REQ3.pack(block_size, block_nr, frame_size, (block_size / frame_size) * block_nr,
+                             timeout, 0, 0)
+            self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * block_nr, mmap.MAP_SHARED,
+                                  mmap.PROT_READ | mmap.PROT_WRITE)
+            self.sock.bind((iface, ETH_P_ALL))
+            if promisc:
+                ifindex = linux.linux_ifindex(iface)
+                self.sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP,
+                                     _MREQ.pack(ifindex, PACKET_MR_PROMISC, 0, ""))
+        except (socket.error, IOError, EnvironmentError) as e:
+            self.sock.close()
+            raise exceptions.EthercutException("Couldn't set up the capture ring on %s: %s" %(iface, e))
+
+        self.poller = select.poll()
+        self.poller.register(self.sock.fileno(), select.POLLIN | select.POLLERR)
+
+    def setfilter(self, expr):
+        """
+        Compiles a filter expression with libpcap and attaches it to the socket
+        """
+        if not expr:
+            return
+        name = ctypes.util.find_library("pcap")
+        if not name:
+            raise exceptions.EthercutException("libpcap is needed to compile the capture filter")
+        lib = ctypes.CDLL(name)
+        lib.pcap_open_dead.restype = ctypes.c_void_p
+        lib.pcap_open_dead.argtypes = [ ctypes.c_int, ctypes.c_int ]
+        lib.pcap_compile.argtypes = [ ctypes.c_void_p, ctypes.POINTER(_BpfProgram), ctypes.c_char_p,
+                                      ctypes.c_int, ctypes.c_uint ]
+        lib.pcap_geterr.restype = ctypes.c_char_p
+        lib.pcap_geterr.argtypes = [ ctypes.c_void_p ]
+        lib.pcap_freecode.argtypes = [ ctypes.POINTER(_BpfProgram) ]
+        lib.pcap_close.argtypes = [ ctypes.c_void_p ]
+
+        handle = lib.pcap_open_dead(DLT_EN10MB, self.snaplen)
+        prog = _BpfProgram()
+        try:
+            if lib.pcap_compile(handle, ctypes.byref(prog), expr, 1, PCAP_NETMASK_UNKNOWN) < 0:
+                raise exceptions.EthercutException("Invalid filter: %s" %lib.pcap_geterr(handle))
+            fprog = _SockFprog(prog.bf_len, prog.bf_insns)
+            # The kernel keeps its own copy of the program
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                                 ctypes.string_at(ctypes.addressof(fprog), ctypes.sizeof(fprog)))
+            lib.pcap_freecode(ctypes.byref(prog))
+        finally:
+            lib.pcap_close(handle)
+
+    def walk(self, timeout=None):
+        """
+        Waits up to timeout milliseconds for the next block and yields its frames as
+        (timestamp, buffer, pkttype) tuples. The buffers point into the ring and are only valid
+        until the next frame is requested, the block is handed back to the kernel once it has
+        been walked.
+        """
+        ring = self.ring
+        off = self.block * self.block_size
+        status, num, first = _BLOCK.unpack_from(ring, off)
+        if not status & TP_STATUS_USER:
+            self.poller.poll(timeout)
+            status, num, first = _BLOCK.unpack_from(ring, off)
+            if not status & TP_STATUS_USER:
+                return
+
+        unpack = _HDR.unpack_from
+        pkt = off + first
+        try:
+            for i in xrange(num):
+                nxt, sec, nsec, snaplen, ln, st, mac = unpack(ring, pkt)
+                yield sec + nsec * 1e-9, buffer(ring, pkt + mac, snaplen), ord(ring[pkt + _PKTTYPE_OFF])
+                pkt += nxt
+        finally:
+            _STATUS.pack_into(ring, off + 8, TP_STATUS_KERNEL)
+            self.block = (self.block + 1) % self.block_nr
+
+    def stats(self):
+        """
+        Returns the kernel counters as a tuple (packets, drops, freezes)
+        """
+        packets, drops, freezes = _STATS.unpack(self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS,
+                                                                     _STATS.size))
+        self.packets += packets
+        self.drops += drops
+        self.freezes += freezes
+        return self.packets, self.drops, self.freezes
+
+    def datalink(self):
+        return DLT_EN10MB
+
+    def close(self):
+        self.poller.unregister(self.sock.fileno())
+        self.ring.close()
+        self.sock.close()
@@ -22,7 +22,7 @@ from ethercut.context import ctx
 
 class CoreOptions(base.OptionGroup):
 
-    __slots__ = [ "_iface", "_gateway", "_use_mac", "default_log" ]
+    __slots__ = [ "_iface", "_gateway", "_use_mac", "default_log", "headless" ]
 
     name = "core"
 
@@ -51,6 +51,8 @@ class CoreOptions(base.OptionGroup):
         #             const=True, default=False)
         self.add_arg("--no-colors", help="Disable colored output", dest="core.color", action="store_const",
                      const=False, default=True)
+        self.add_arg("--headless", help="Run without a terminal: no keyboard input nor countdown, the messages are "+
+                     "written as JSON lines", dest="core.headless", action="store_const", const=True, default=False)
         # Version and help
         self.add_arg("-v", "--version", action="version", version="%s" %VERSION,
                         help="Show program's version number and exit")
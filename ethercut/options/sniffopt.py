@@ -19,8 +19,8 @@ from ethercut.types.colorstr import CStr
 
 class SniffOptions(base.OptionGroup):
 
-    __slots__ = [ "sniff", "_read", "_write", "filter", "_promisc",
-                  "_decoders" ]
+    __slots__ = [ "sniff", "_read", "_write", "filter", "_promisc", "realtime",
+                  "_decoders", "_dump_size", "_dump_files", "_dump_time" ]
 
     name = "sniff"
 
@@ -33,8 +33,17 @@ class SniffOptions(base.OptionGroup):
         default_file = utils.get_default_file("ethercut_cap", ".pcap")
         self.add_arg("-w", "--write-packets", help="Dump all sniffed packets in pcapfile <file> [default:%s]"
                     % CStr(default_file).yellow, metavar="<file>", nargs="?", dest="sniff.write", const=default_file)
+        self.add_arg("--write-size", help="Rotate the dump file when it reaches <size> MB", metavar="<size>",
+                    type=int, default=0, dest="sniff.dump_size")
+        self.add_arg("--write-time", help="Rotate the dump file every <secs> seconds", metavar="<secs>",
+                    type=int, default=0, dest="sniff.dump_time")
+        self.add_arg("--write-files", help="Keep only the last <count> dump files when rotating", metavar="<count>",
+                    type=int, default=0, dest="sniff.dump_files")
         self.add_arg("-r", "--read-packets", help="Read packets from pcapfile <file> (will enable -s)", metavar="<file>",
                     nargs="?", dest="sniff.read")
+        self.add_arg("--realtime", help="Process the packets read with -r at the pace they were captured "+
+                    "(they are processed as fast as possible by default)", dest="sniff.realtime",
+                    action="store_const", const=True, default=False)
         self.add_arg("-f", "--pcapfilter", help="Set this pcap filter <filter>", metavar="<filter>",
                     dest="sniff.filter", default="")
         self.add_arg("-p", "--promisc", help="Put the interface in promiscuous mode", dest="sniff.promisc",
@@ -67,6 +76,36 @@ class SniffOptions(base.OptionGroup):
             self.sniff = True
         self._read = val
 
+    @property
+    def dump_size(self):
+        return self._dump_size
+
+    @dump_size.setter
+    def dump_size(self, val):
+        if val < 0:
+            raise exceptions.EthercutException("Invalid dump file size \"%s\"" %val)
+        self._dump_size = val << 20 # MB to bytes
+
+    @property
+    def dump_time(self):
+        return self._dump_time
+
+    @dump_time.setter
+    def dump_time(self, val):
+        if val < 0:
+            raise exceptions.EthercutException("Invalid dump file rotation time \"%s\"" %val)
+        self._dump_time = val
+
+    @property
+    def dump_files(self):
+        return self._dump_files
+
+    @dump_files.setter
+    def dump_files(self, val):
+        if val < 0:
+            raise exceptions.EthercutException("Invalid number of dump files \"%s\"" %val)
+        self._dump_files = val
+
     @property
     def promisc(self):
         return self._promisc
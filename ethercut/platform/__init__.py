@@ -18,8 +18,16 @@ if LINUX:
     enable_ip_forward = linux_enable_forward
     disable_ip_forward = linux_disable_forward
     check_ip_forward = linux_check_forward
+
+    from ethercut.platform.linux import linux_get_iface, linux_gateway, linux_arp_cache
+    get_iface = linux_get_iface
+    get_gateway = linux_gateway
+    arp_cache = linux_arp_cache
 elif DARWIN:
     from ethercut.platform.darwin import darwin_enable_forward, darwin_disable_forward, darwin_check_forward
     enable_ip_forward = darwin_enable_forward
     disable_ip_forward = darwin_disable_forward
     check_ip_forward = darwin_check_forward
+
+    # No native backend, the ifconfig/netstat/arp output is parsed
+    get_iface = get_gateway = arp_cache = None
@@ -10,6 +10,10 @@
 Linux specific stuff
 """
 
+import fcntl
+import socket
+import struct
+
 ############################
 ##  Kernel IP forwarding  ##
 ############################
@@ -21,6 +25,120 @@ def linux_enable_forward():
 def linux_disable_forward():
     with open("/proc/sys/net/ipv4/ip_forward", "w") as f:
         f.write("0")
+
 def linux_check_forward():
     with open("/proc/sys/net/ipv4/ip_forward", "r") as f:
         return f.read()
+
+##################
+##  Interfaces  ##
+##################
+
+SIOCGIFADDR    = 0x8915
+SIOCGIFBRDADDR = 0x8919
+SIOCGIFNETMASK = 0x891b
+
+def _sysfs_read(iface, attr):
+    with open("/sys/class/net/%s/%s" %(iface, attr), "r") as f:
+        return f.read().strip()
+
+def _ifreq_addr(sock, req, iface):
+    """
+    Gets an IPv4 address of iface with an ioctl, None if it isn't configured
+    """
+    try:
+        ifr = fcntl.ioctl(sock.fileno(), req, struct.pack("256s", iface[:15]))
+    except IOError:
+        return None
+    return socket.inet_ntoa(ifr[20:24])
+
+def linux_ifindex(iface):
+    """
+    Returns the index of a network interface
+    """
+    return int(_sysfs_read(iface, "ifindex"))
+
+def linux_get_iface(iface):
+    """
+    Returns a dictionary with the configuration of a network interface, read from
+    /sys/class/net, ioctls and /proc/net/if_inet6 (see utils.get_iface()).
+    Raises IOError if the interface doesn't exist.
+    """
+    ret = {"hw": None, "inet": None, "bcast": None, "netmask": None, "inet6": None, "mtu": None}
+    ret["hw"] = _sysfs_read(iface, "address") or None
+    ret["mtu"] = _sysfs_read(iface, "mtu")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        ret["inet"] = _ifreq_addr(sock, SIOCGIFADDR, iface)
+        if ret["inet"]:
+            ret["netmask"] = _ifreq_addr(sock, SIOCGIFNETMASK, iface)
+            ret["bcast"] = _ifreq_addr(sock, SIOCGIFBRDADDR, iface)
+    finally:
+        sock.close()
+
+    try:
+        with open("/proc/net/if_inet6", "r") as f:
+            for l in f:
+                # Address, index, prefix length, scope, flags, device
+                data = l.split()
+                if len(data) < 6 or data[5] != iface:
+                    continue
+                addr = data[0]
+                addr = ":".join(addr[i:i+4] for i in xrange(0, 32, 4))
+                addr = socket.inet_ntop(socket.AF_INET6, socket.inet_pton(socket.AF_INET6, addr))
+                ret["inet6"] = "%s/%d" %(addr, int(data[2], 16))
+                break
+    except IOError:
+        pass # No IPv6 support
+
+    return ret
+
+###############
+##  Routing  ##
+###############
+
+RTF_UP      = 0x1
+RTF_GATEWAY = 0x2
+
+def linux_gateway():
+    """
+    Returns the gateway of the default route from /proc/net/route, None if there is no
+    default route
+    """
+    with open("/proc/net/route", "r") as f:
+        f.readline() # Skip the header
+        for l in f:
+            # Iface, Destination, Gateway, Flags, RefCnt, Use, Metric, Mask...
+            data = l.split()
+            if len(data) < 4 or data[1] != "00000000":
+                continue
+            flags = int(data[3], 16)
+            if flags & RTF_UP and flags & RTF_GATEWAY:
+                # Addresses are written in host byte order
+                return socket.inet_ntoa(struct.pack("=I", int(data[2], 16)))
+    return None
+
+#################
+##  ARP cache  ##
+#################
+
+ATF_COM = 0x02 # Completed entry
+
+def linux_arp_cache(iface=None):
+    """
+    Reads the complete entries of the kernel ARP cache for an interface (all the interfaces if
+    iface is None). Returns a dictionary {ip: mac}
+    """
+    ret = {}
+    with open("/proc/net/arp", "r") as f:
+        f.readline() # Skip the header
+        for l in f:
+            # IP address, HW type, Flags, HW address, Mask, Device
+            data = l.split()
+            if len(data) < 6 or (iface and data[5] != iface):
+                continue
+            if not int(data[2], 16) & ATF_COM:
+                continue
+            ret[data[0]] = data[3]
+    return ret
@@ -0,0 +1,144 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Linux rtnetlink: neighbour (ARP) table events
+"""
+
+import errno
+import socket
+import struct
+
+NETLINK_ROUTE = 0
+RTMGRP_NEIGH  = 0x4
+
+# Message types
+NLMSG_ERROR  = 2
+NLMSG_DONE   = 3
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+
+# Flags
+NLM_F_REQUEST = 0x001
+NLM_F_ROOT    = 0x100
+NLM_F_MATCH   = 0x200
+NLM_F_DUMP    = NLM_F_ROOT | NLM_F_MATCH
+
+# Neighbour attributes
+NDA_DST    = 1
+NDA_LLADDR = 2
+
+# Neighbour states
+NUD_INCOMPLETE = 0x01
+NUD_REACHABLE  = 0x02
+NUD_STALE      = 0x04
+NUD_DELAY      = 0x08
+NUD_PROBE      = 0x10
+NUD_FAILED     = 0x20
+NUD_NOARP      = 0x40
+NUD_PERMANENT  = 0x80
+NUD_VALID      = NUD_PERMANENT | NUD_NOARP | NUD_REACHABLE | NUD_PROBE | NUD_STALE | NUD_DELAY
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NDMSG    = struct.Struct("=BxxxiHBB")
+_RTATTR   = struct.Struct("=HH")
+
+
+class NeighbourSocket(object):
+    """
+    rtnetlink socket subscribed to the IPv4 neighbour table of an interface. It receives the
+    RTM_NEWNEIGH/RTM_DELNEIGH notifications sent by the kernel and can request a dump of the
+    whole table (the entries of the dump are returned as RTM_NEWNEIGH events).
+
+    +param: ifindex - Index of the interface (0 for all the interfaces)
+    """
+
+    __slots__ = [ "sock", "ifindex", "seq" ]
+
+    def __init__(self, ifindex=0):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, RTMGRP_NEIGH))
+        self.ifindex = ifindex
+        self.seq = 0
+
+    def request_dump(self):
+        """
+        Asks the kernel for the whole neighbour table
+        """
+        self.seq += 1
+        ndm = _NDMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        hdr = _NLMSGHDR.pack(_NLMSGHDR.size + len(ndm), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP,
+                             self.seq, 0)
+        self.sock.send(hdr + ndm)
+
+    def recv(self, timeout=None):
+        """
+        Waits for neighbour messages. Returns a list of (event, ip, mac, state) tuples, with the
+        IP address as an integer and the MAC address in binary form (None if the entry has no
+        link layer address). Returns None if the timeout expires.
+
+        If the socket buffer overflowed some events were lost, in that case a new dump is
+        requested and an empty list is returned.
+        """
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return None
+        except socket.error as e:
+            if e.errno != errno.ENOBUFS:
+                raise
+            self.request_dump()
+            return []
+        return self.parse(data)
+
+    def parse(self, data):
+        """
+        Parses a buffer with netlink messages
+        """
+        events = []
+        off = 0
+        ln = len(data)
+        while off + _NLMSGHDR.size <= ln:
+            msglen, msgtype, flags, seq, pid = _NLMSGHDR.unpack_from(data, off)
+            if msglen < _NLMSGHDR.size:
+                break
+            end = off + msglen
+            if msgtype in (RTM_NEWNEIGH, RTM_DELNEIGH):
+                ev = self.parse_neigh(msgtype, data, off + _NLMSGHDR.size, end)
+                if ev is not None:
+                    events.append(ev)
+            off += (msglen + 3) & ~3
+        return events
+
+    def parse_neigh(self, msgtype, data, off, end):
+        """
+        Parses a ndmsg and its attributes
+        """
+        family, ifindex, state, flags, ntype = _NDMSG.unpack_from(data, off)
+        if family != socket.AF_INET or (self.ifindex and ifindex != self.ifindex):
+            return None
+        ip = mac = None
+        off += _NDMSG.size
+        while off + _RTATTR.size <= end:
+            alen, atype = _RTATTR.unpack_from(data, off)
+            if alen < _RTATTR.size:
+                break
+            payload = data[off+_RTATTR.size:off+alen]
+            if atype == NDA_DST and len(payload) == 4:
+                ip, = struct.unpack("!I", payload)
+            elif atype == NDA_LLADDR and len(payload) == 6:
+                mac = payload
+            off += (alen + 3) & ~3
+        if ip is None:
+            return None
+        return msgtype, ip, mac, state
+
+    def close(self):
+        self.sock.close()
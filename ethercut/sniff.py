@@ -10,61 +10,184 @@
 Sniffing thread module
 """
 
-import pcap
-import scapy.utils
+import pcap, time
+import ethercut.dump as dump
+import ethercut.utils as utils
+import ethercut.const as const
+import ethercut.exceptions as exceptions
+import ethercut.net.bpf as bpf
+import ethercut.metrics as metrics
+import ethercut.net.frame as frame
+import ethercut.net.pcapfile as pcapfile
+import ethercut.net.tpacket as tpacket
 import ethercut.types.basethread as basethread
-import scapy.layers.l2 as l2
 
 from ethercut.config import ethconf
 from ethercut.context import ctx
 from ethercut.types.colorstr import CStr
 
 
+# Records read from a file at once
+FILE_BATCH = 1024
+
+# Seconds to wait for the sniffing thread to exit
+JOIN_TIMEOUT = 5
+
+
 class Sniffer(basethread.BaseThread):
     """
     Packet sniffing thread: this thread is responsible of capturing/reading the packets and pushing
     them to the captured packets queue.
-    If a dump file is specified, the packets will be dumped on it.
+    If a dump file is specified, the packets will be handed to the dump writer thread.
+
+    Live captures can use a TPACKET_V3 ring instead of pcap (capture_backend in the [sniff]
+    configuration). Classic pcap files are read with the memory mapped reader and the packets
+    are passed straight to the koala filter, libpcap is only used to read pcapng files or when a
+    filter is given.
+
+    The frames we send (injected or forwarded) are captured again when sniffing live, they are
+    discarded before doing anything else with them and counted as echoed in the filter stats.
+    With pcap they are discarded by the kernel when it supports capturing only the incoming
+    frames, then the frames we send are counted as echoed.
+
+    +param: koala - KoalaFilter
     """
 
-    def __init__(self):
+    def __init__(self, koala):
         super(Sniffer, self).__init__("Sniffing")
+        self.koala = koala
+        self.stats = koala.stats
+        self.captured = metrics.registry.counter("sniff.packets")
+        # Time spent on every packet (only measured when the packets come in batches)
+        self.latency = metrics.registry.histogram("sniff.latency")
         self.pcap = None
+        self.ring = None
+        self.reader = None
         self.dumpfile = None
+        self.dumper = None
         self.enabled = False
+        # Frames sent to our MAC address may have to be forwarded, they are never shed. Frames
+        # sent from it are our own
+        self.iface_mac = None
 
     def start(self):
         if not self.enabled:
             return
+        if self.dumper:
+            self.dumper.start()
         super(Sniffer, self).start()
 
     def run(self):
         try:
-            while self.running:
-                # Get the packet anf timestamp from pcap
-                ret = self.pcap.__next__()
-                if not ret:
-                    continue
-                ts, pkt = ret
-                packet = l2.Ether(str(pkt))
-                packet.time = ts
-                # Put the packet in the sniffed queue to be processed later
-                ctx.sniffed_packets.put(packet)
-                # Write the packet in the dump file
-                if self.dumpfile:
-                    scapy.utils.wrpcap(self.dumpfile, packet, append=True)
+            if self.ring:
+                self.capture_ring()
+            elif self.reader:
+                self.read_file()
+            else:
+                self.capture_pcap()
         except StopIteration:
             # Raised when EOF is reached while reading from a file
             self.end(False)
         except Exception as e:
-            print "Hoooooolay: %s" %str(e)
+            # Capture can't go on, report it and let the filter finish with what it has
+            ctx.ui.error("The sniffer stopped: %s" %e)
+            self.end(False)
+
+    def capture_pcap(self):
+        """
+        Captures the packets one by one with pcap
+        """
+        while self.running:
+            # Get the packet anf timestamp from pcap
+            ret = self.pcap.__next__()
+            if not ret:
+                continue
+            ts, pkt = ret
+            self.captured.inc()
+            # Discard our own frames (when the kernel can't do it for us)
+            if pkt[6:12] == self.iface_mac:
+                self.stats.echoed.inc()
+                continue
+            # pcap reuses its buffer for the next packet, so keep a copy. Scapy dissection
+            # is deferred until a decoder needs it
+            pkt = str(pkt)
+            packet = frame.RawFrame(ts, pkt)
+            # Put the packet in the sniffed queue to be processed later
+            ctx.sniffed_packets.put(packet, priority=pkt[0:6] == self.iface_mac)
+            # Write the packet in the dump file
+            if self.dumper:
+                self.dumper.push(ts, pkt)
+
+    def capture_ring(self):
+        """
+        Captures the packets a block at a time from the TPACKET_V3 ring
+        """
+        ring = self.ring
+        mac = self.iface_mac
+        while self.running:
+            forward = []
+            rest = []
+            echoed = 0
+            start = time.time()
+            for ts, view, pkttype in ring.walk(100):
+                # The frame is checked in place, only the frames we keep are copied out of the
+                # ring (the block is given back to the kernel right after walking it)
+                if pkttype == tpacket.PACKET_OUTGOING or view[6:12] == mac:
+                    echoed += 1
+                    continue
+                pkt = view[:]
+                if pkt[0:6] == mac:
+                    forward.append(frame.RawFrame(ts, pkt))
+                else:
+                    rest.append(frame.RawFrame(ts, pkt))
+                if self.dumper:
+                    self.dumper.push(ts, pkt)
+            n = len(forward) + len(rest) + echoed
+            if n:
+                self.latency.observe((time.time() - start) / n, n)
+                self.captured.inc(n)
+                self.stats.echoed.inc(echoed)
+            ctx.sniffed_packets.put_batch(forward, priority=True)
+            ctx.sniffed_packets.put_batch(rest)
+
+    def read_file(self):
+        """
+        Reads the pcap file in batches and hands them to the koala filter. By default the file
+        is read as fast as possible, with --realtime the packets are processed at the pace
+        they were captured.
+        """
+        reader = self.reader
+        process = self.koala.process
+        realtime = ctx.opt.sniff.realtime
+        start = first = None
+        while self.running:
+            batch = reader.read_batch(FILE_BATCH)
+            if not batch:
+                raise StopIteration
+            self.captured.inc(len(batch))
+            frames = [frame.RawFrame(ts, buf) for ts, buf in batch]
+            if self.dumper:
+                for ts, buf in batch:
+                    self.dumper.push(ts, str(buf))
+            if not realtime:
+                process(frames)
+                continue
+            for f in frames:
+                if start is None:
+                    start, first = time.time(), f.time
+                delay = (f.time - first) - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                process([f])
 
     def end(self, join=True):
         if not self.running:
             return
         # Put None in the queue to signal the end of the capturing process
         ctx.sniffed_packets.put(None)
-        super(Sniffer, self).end(join)
+        super(Sniffer, self).end(join, JOIN_TIMEOUT)
+        if self.dumper:
+            self.dumper.end()
 
     def configure(self):
         """
@@ -72,18 +195,87 @@ class Sniffer(basethread.BaseThread):
         """
         if ctx.opt.sniff.sniff:
             src = ctx.opt.sniff.read or ctx.iface.name
-            self.pcap = pcap.pcap(src, ethconf.snaplen, ctx.opt.sniff.promisc, ethconf.sniff_timeout)
-            self.pcap.setfilter(ctx.opt.sniff.filter)
+            if ethconf.capture_backend not in ("pcap", "tpacket"):
+                raise exceptions.EthercutException("Invalid capture backend \"%s\" (pcap or tpacket)"
+                                                   %ethconf.capture_backend)
+            if ctx.opt.sniff.read and not ctx.opt.sniff.filter and pcapfile.PcapFile.is_pcap(src):
+                self.reader = pcapfile.PcapFile(src)
+                self.koala.inline = True
+            elif ethconf.capture_backend == "tpacket" and not ctx.opt.sniff.read:
+                if not const.LINUX:
+                    raise exceptions.EthercutException("The tpacket capture backend is only available on Linux")
+                self.ring = tpacket.TPacketRing(src, ethconf.snaplen, ctx.opt.sniff.promisc,
+                                                ethconf.ring_block_size, ethconf.ring_blocks,
+                                                ethconf.ring_timeout)
+                self.stats.capture = self.ring
+            else:
+                self.pcap = pcap.pcap(src, ethconf.snaplen, ctx.opt.sniff.promisc, ethconf.sniff_timeout)
             self.dumpfile = ctx.opt.sniff.write
+            auto = self.set_filter() if not self.reader else None
+            if not ctx.opt.sniff.read:
+                self.iface_mac = utils.mton(ctx.iface.mac)
+            if self.pcap and not ctx.opt.sniff.read:
+                # Only capture the incoming frames, so the ones we send never reach us
+                try:
+                    self.pcap.setdirection(pcap.PCAP_D_IN)
+                except (AttributeError, OSError):
+                    pass # Not supported, they are discarded in run()
+                else:
+                    self.stats.echo_in_kernel()
+            handle = self.ring or self.reader or self.pcap
+            if self.dumpfile:
+                self.dumper = dump.DumpWriter(self.dumpfile, handle.datalink(), ethconf.snaplen,
+                                              ctx.opt.sniff.dump_size, ctx.opt.sniff.dump_files,
+                                              ctx.opt.sniff.dump_time)
 
             sniff_source = "offline (%s)" if ctx.opt.sniff.read else "live (%s)"
             ctx.ui.msg("Sniffing %s" %sniff_source%CStr(src).green)
+            if self.reader:
+                ctx.ui.msg("Fast file reader | Pace: %s" %CStr("real time" if ctx.opt.sniff.realtime
+                                                               else "as fast as possible").green)
+            if self.ring:
+                ctx.ui.msg("Capture ring | Blocks: %s x %sKB" %(CStr(self.ring.block_nr).green,
+                                                                CStr(self.ring.block_size >> 10).green))
             if ctx.opt.sniff.filter:
                 ctx.ui.msg("Pcap filter: \"%s\"" %CStr(ctx.opt.sniff.filter).green)
+            if auto:
+                ctx.ui.msg("Kernel filter: \"%s\"" %CStr(auto if len(auto) < 200 else auto[:200]+"...").green)
             if self.dumpfile:
                 ctx.ui.msg("Dump file: %s" %CStr(ctx.opt.sniff.write).green)
+                if self.dumper.maxsize or self.dumper.maxtime:
+                    size = "%sMB" %(self.dumper.maxsize >> 20) if self.dumper.maxsize else "off"
+                    secs = "%ss" %self.dumper.maxtime if self.dumper.maxtime else "off"
+                    ctx.ui.msg("Dump rotation | Size: %s | Time: %s | Files: %s" %(CStr(size).green,
+                                                                                CStr(secs).green,
+                                                                                CStr(self.dumper.maxfiles or "all").green))
             self.enabled = True
 
         else:
             ctx.ui.msg("Sniffer module disabled, ethercut won't collect any data (enable it with -s)")
             self.enabled = False
+
+    def set_filter(self):
+        """
+        Installs the user filter ANDed with a filter generated from the TARGETs, so the packets
+        that the koala filter would drop or ignore are rejected in the kernel. Returns the
+        generated filter (None if it wasn't used).
+        """
+        auto = None
+        # A dump file must get every packet
+        if ethconf.auto_filter and not self.dumpfile:
+            if ctx.opt.sniff.read:
+                auto = bpf.auto_filter(ctx.target1, ctx.target2)
+            else:
+                # If the koala filter forwards the packets, it needs all of them
+                targets = ctx.opt.attack.kill or ctx.opt.attack.unoffensive
+                auto = bpf.auto_filter(ctx.target1, ctx.target2, ctx.iface.mac, ctx.iface.ip,
+                                       targets)
+        handle = self.ring or self.pcap
+        if auto:
+            try:
+                handle.setfilter(bpf.join(ctx.opt.sniff.filter, auto))
+                return auto
+            except Exception as e:
+                ctx.ui.msg("Couldn't install the kernel filter (%s), using the pcap filter only" %e)
+        handle.setfilter(ctx.opt.sniff.filter)
+        return None
@@ -42,12 +42,14 @@ class BaseThread(threading.Thread):
         """
         raise NotImplementedError
 
-    def end(self, join=True):
+    def end(self, join=True, timeout=None):
         """
-        Terminate the thread's activity by clearing the "running" flag
+        Terminate the thread's activity by clearing the "running" flag. If timeout is given,
+        the join gives up after that many seconds (the thread is a daemon, it won't keep the
+        program alive).
         """
         if not self.running: # Prevent from joining a thread when it is not active
             return
         self.running = False
         if join:
-            threading.Thread.join(self) # Wait until the thread exits cleanly
+            threading.Thread.join(self, timeout) # Wait until the thread exits cleanly
@@ -0,0 +1,130 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Batch queue: A Queue that can hand over several items with a single lock acquisition
+"""
+
+import time
+import Queue
+
+
+# Overload policies, what to do with a new item when the queue is full
+BLOCK       = "block"        # Wait until there is room
+DROP_NEWEST = "drop-newest"  # Discard the new item
+DROP_OLDEST = "drop-oldest"  # Discard the oldest queued item to make room
+SHED        = "shed"         # Wait for priority items, discard the rest
+
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, SHED)
+
+
+class BatchQueue(Queue.Queue):
+    """
+    Subclass of Queue.Queue with batch operations. Consumers block until there is at least one
+    item in the queue and then take all the available items (up to maxitems) at once, so the
+    locking and wake-up cost is paid per batch and not per item.
+
+    When the queue is bounded (maxsize > 0) the overload policy decides what happens with new
+    items once it is full. The items discarded are counted in the dropped attribute. None is
+    used as an end of activity marker by the consumers, so it is never discarded and it never
+    waits for room (stopping a consumer can't block on a full queue).
+
+    +param: maxsize - Capacity of the queue (0 for unbounded)
+    +param: policy  - Overload policy (BLOCK, DROP_NEWEST, DROP_OLDEST or SHED)
+    """
+
+    def __init__(self, maxsize=0, policy=BLOCK):
+        Queue.Queue.__init__(self, maxsize)
+        self.policy = BLOCK
+        self.dropped = 0
+        self.set_limits(maxsize, policy)
+
+    def set_limits(self, maxsize, policy):
+        """
+        Changes the capacity and the overload policy of the queue
+        """
+        if policy not in POLICIES:
+            raise ValueError("Invalid queue policy \"%s\" (%s)" %(policy, ", ".join(POLICIES)))
+        if maxsize < 0:
+            raise ValueError("Invalid queue size %s" %maxsize)
+        self.mutex.acquire()
+        try:
+            self.maxsize = maxsize
+            self.policy = policy
+            self.not_full.notify_all()
+        finally:
+            self.mutex.release()
+
+    def put(self, item, block=True, timeout=None, priority=False):
+        """
+        Put an item into the queue. With the SHED policy, the priority items wait for room and
+        the rest are discarded when the queue is full.
+        """
+        if item is not None and (self.policy == BLOCK or (priority and self.policy == SHED)):
+            Queue.Queue.put(self, item, block, timeout)
+        else:
+            self.put_batch([item])
+
+    def put_batch(self, items, priority=False):
+        """
+        Put a list of items into the queue, applying the overload policy to every item that
+        doesn't fit
+        """
+        if not items:
+            return
+        self.not_full.acquire()
+        try:
+            for item in items:
+                if item is not None and 0 < self.maxsize <= self._qsize():
+                    if self.policy == BLOCK or (priority and self.policy == SHED):
+                        while 0 < self.maxsize <= self._qsize():
+                            self.not_full.wait()
+                    elif self.policy == DROP_OLDEST and self.queue[0] is not None:
+                        self._get()
+                        self.unfinished_tasks -= 1
+                        self.dropped += 1
+                    else:
+                        self.dropped += 1
+                        continue
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+        finally:
+            self.not_full.release()
+
+    def get_batch(self, maxitems, block=True, timeout=None):
+        """
+        Remove and return a list with up to maxitems items from the queue.
+
+        If block is True and timeout is None, it will wait until an item is available.
+        If timeout is a positive number, it will wait at most timeout seconds and return an
+        empty list if no item was available within that time.
+        If block is False, it will return the available items (maybe none) immediately.
+        """
+        self.not_empty.acquire()
+        try:
+            if not block:
+                pass
+            elif timeout is None:
+                while not self._qsize():
+                    self.not_empty.wait()
+            else:
+                endtime = time.time() + timeout
+                while not self._qsize():
+                    remaining = endtime - time.time()
+                    if remaining <= 0.0:
+                        break
+                    self.not_empty.wait(remaining)
+
+            n = min(maxitems, self._qsize())
+            items = [self._get() for i in xrange(n)]
+            if n:
+                self.not_full.notify(n)
+            return items
+        finally:
+            self.not_empty.release()
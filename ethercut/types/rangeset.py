@@ -0,0 +1,151 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Compact sets for ports and address ranges
+"""
+
+import bisect
+
+
+class PortSet(object):
+    """
+    Set of TCP/UDP ports stored as a 65536 bit bitmap, membership tests take constant time
+    no matter how wide the port ranges are.
+
+    +param: ports - Iterable with the initial ports
+    """
+
+    __slots__ = [ "bitmap", "count" ]
+
+    def __init__(self, ports=()):
+        self.bitmap = bytearray(8192)
+        self.count = 0
+        for p in ports:
+            self.add(p)
+
+    def add(self, port):
+        """
+        Adds a port to the set
+        """
+        if port < 0 or port > 65535:
+            raise ValueError("Port out of range (0-65535) \"%s\"" %port)
+        byte, bit = port >> 3, 1 << (port & 7)
+        if not self.bitmap[byte] & bit:
+            self.bitmap[byte] |= bit
+            self.count += 1
+
+    def add_range(self, first, last):
+        """
+        Adds all the ports between first and last (both included)
+        """
+        for p in xrange(first, last+1):
+            self.add(p)
+
+    def __contains__(self, port):
+        try:
+            return bool(self.bitmap[port >> 3] & (1 << (port & 7)))
+        except (TypeError, IndexError):
+            return False
+
+    def __iter__(self):
+        for byte, bits in enumerate(self.bitmap):
+            if bits:
+                for bit in xrange(8):
+                    if bits & (1 << bit):
+                        yield (byte << 3) | bit
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "PortSet(%s)" %", ".join(map(str, self))
+
+
+class IntRangeSet(object):
+    """
+    Set of integers (e.g. IPv4 addresses) stored as sorted and non overlapping [first, last]
+    intervals. Membership tests are a binary search over the intervals.
+
+    +param: ranges - Iterable with the initial (first, last) intervals
+    """
+
+    __slots__ = [ "starts", "ends", "count" ]
+
+    def __init__(self, ranges=()):
+        self.starts = []
+        self.ends = []
+        self.count = 0
+        for first, last in ranges:
+            self.add_range(first, last)
+
+    def add_range(self, first, last):
+        """
+        Adds all the integers between first and last (both included)
+        """
+        if last < first:
+            raise ValueError("Invalid range %s-%s" %(first, last))
+        # Find the intervals that overlap or are adjacent to the new one and merge them
+        lo = bisect.bisect_left(self.ends, first - 1)
+        hi = bisect.bisect_right(self.starts, last + 1)
+        if lo < hi:
+            first = min(first, self.starts[lo])
+            last = max(last, self.ends[hi-1])
+            for i in xrange(lo, hi):
+                self.count -= self.ends[i] - self.starts[i] + 1
+        self.starts[lo:hi] = [first]
+        self.ends[lo:hi] = [last]
+        self.count += last - first + 1
+
+    def add(self, x):
+        """
+        Adds an integer to the set
+        """
+        self.add_range(x, x)
+
+    def discard(self, x):
+        """
+        Removes an integer from the set (if it is in it)
+        """
+        i = bisect.bisect_right(self.starts, x) - 1
+        if i < 0 or x > self.ends[i]:
+            return
+        first, last = self.starts[i], self.ends[i]
+        pieces = [(a, b) for a, b in ((first, x-1), (x+1, last)) if a <= b]
+        self.starts[i:i+1] = [a for a, b in pieces]
+        self.ends[i:i+1] = [b for a, b in pieces]
+        self.count -= 1
+
+    def ranges(self):
+        """
+        Returns a list with all the (first, last) intervals
+        """
+        return zip(self.starts, self.ends)
+
+    def chunks(self, n):
+        """
+        Iterates over the set in lists of at most n integers
+        """
+        for first, last in self.ranges():
+            for x in xrange(first, last+1, n):
+                yield range(x, min(x+n, last+1))
+
+    def __contains__(self, x):
+        i = bisect.bisect_right(self.starts, x) - 1
+        return i >= 0 and x <= self.ends[i]
+
+    def __iter__(self):
+        for first, last in zip(self.starts, self.ends):
+            for x in xrange(first, last+1):
+                yield x
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "IntRangeSet(%s)" %self.ranges()
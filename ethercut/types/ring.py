@@ -0,0 +1,223 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Packet ring: single producer, single consumer ring of packets in shared memory
+"""
+
+import mmap
+import time
+import struct
+import multiprocessing
+
+# Shared header: head, tail (bytes written and read since the creation of the ring), packets
+# dropped, closed flag and consumer waiting flag. Native format, so every counter is written
+# with a single aligned store and the other process never sees it half written
+_HEADER = struct.Struct("@QQQQQ")
+_HEAD    = 0
+_TAIL    = 8
+_DROPPED = 16
+_CLOSED  = 24
+_WAITING = 32
+_COUNTER = struct.Struct("@Q")
+
+# Slot header: capture timestamp and length of the packet
+_SLOT = struct.Struct("@dI4x")
+
+# Length of the marker that tells the consumer to go back to the beginning of the ring
+_WRAP = 0xffffffff
+
+# Maximum seconds a consumer sleeps before checking the ring again, in case it misses
+# a wake-up
+WAIT_TIME = 0.05
+
+# Seconds a blocked producer sleeps before checking whether the consumer freed some room
+ROOM_WAIT_TIME = 0.001
+
+
+class PacketRing(object):
+    """
+    Fixed size ring of packets in a shared memory mapping. Every slot holds the capture
+    timestamp, the length and the bytes of a packet (padded to 8 bytes), so the memory used
+    is capped by the size of the ring. When the ring is full the new packets are discarded
+    and counted in dropped, unless the producer chooses to wait for room.
+
+    The ring must be created before forking, the producer and the consumer may then live in
+    different processes. There can only be one of each. The consumer gets the packets as
+    buffers into the ring, they are valid until its next call to read_batch().
+
+    The positions are published after the slots are written, the consumer relies on seeing
+    the stores in that order (as it does on x86).
+
+    +param: size - Size of the ring in bytes
+    """
+
+    __slots__ = [ "map", "size", "doorbell", "head", "tail", "policy" ]
+
+    def __init__(self, size=16 << 20):
+        size = (size + 7) & ~7
+        if size < 2 * _SLOT.size:
+            raise ValueError("Invalid ring size %s" %size)
+        self.size = size
+        # Anonymous mappings are shared with the forked processes
+        self.map = mmap.mmap(-1, _HEADER.size + size)
+        # Rung by the producer when the consumer is waiting for packets
+        self.doorbell = multiprocessing.Semaphore(0)
+        # Local copies of the positions, the producer owns head and the consumer tail
+        self.head = 0
+        self.tail = 0
+        # Overload policy, as reported by the queues
+        self.policy = "drop-newest"
+
+    @property
+    def dropped(self):
+        """
+        Number of packets discarded because the ring was full
+        """
+        return _COUNTER.unpack_from(self.map, _DROPPED)[0]
+
+    ################
+    ##  Producer  ##
+    ################
+
+    def put_batch(self, items, block=False, timeout=None):
+        """
+        Writes a list of (timestamp, bytes) tuples in the ring and wakes the consumer up.
+        If the ring is full the rest of the packets are dropped or, if block is True, the
+        producer waits for the consumer to free some room (for at most timeout seconds if
+        timeout is given). Returns the number of packets written.
+        """
+        m = self.map
+        size = self.size
+        head = self.head
+        tail = _COUNTER.unpack_from(m, _TAIL)[0]
+        written = 0
+        full = False
+        deadline = time.time() + timeout if block and timeout is not None else None
+        for ts, buf in items:
+            ln = len(buf)
+            need = _SLOT.size + ((ln + 7) & ~7)
+            pos = head % size
+            waste = size - pos if pos + need > size else 0
+            while head + waste + need - tail > size:
+                if (not block or waste + need > size or
+                        (deadline is not None and time.time() >= deadline)):
+                    full = True
+                    break
+                # Hand the packets written so far to the consumer and wait until it reads some
+                if written:
+                    self.head = head
+                    _COUNTER.pack_into(m, _HEAD, head)
+                    self.ring()
+                time.sleep(ROOM_WAIT_TIME)
+                tail = _COUNTER.unpack_from(m, _TAIL)[0]
+            if full:
+                break
+            if waste:
+                # Doesn't fit before the end of the ring, continue at the beginning
+                if waste >= _SLOT.size:
+                    _SLOT.pack_into(m, _HEADER.size + pos, 0, _WRAP)
+                head += waste
+                pos = 0
+            off = _HEADER.size + pos
+            _SLOT.pack_into(m, off, ts, ln)
+            off += _SLOT.size
+            m[off:off + ln] = str(buf)
+            head += need
+            written += 1
+
+        if written:
+            self.head = head
+            _COUNTER.pack_into(m, _HEAD, head)
+            self.ring()
+        if written < len(items):
+            dropped = _COUNTER.unpack_from(m, _DROPPED)[0]
+            _COUNTER.pack_into(m, _DROPPED, dropped + len(items) - written)
+        return written
+
+    def close(self):
+        """
+        Tells the consumer that no more packets will be written
+        """
+        _COUNTER.pack_into(self.map, _CLOSED, 1)
+        self.doorbell.release()
+
+    def ring(self):
+        """
+        Wakes the consumer up if it is waiting for packets
+        """
+        if _COUNTER.unpack_from(self.map, _WAITING)[0]:
+            _COUNTER.pack_into(self.map, _WAITING, 0)
+            self.doorbell.release()
+
+    ################
+    ##  Consumer  ##
+    ################
+
+    def read_batch(self, maxitems, timeout=None):
+        """
+        Returns a list with up to maxitems (timestamp, buffer) tuples. The slots read by the
+        previous call are handed back to the producer first.
+
+        Blocks until there are packets or timeout seconds have passed (then [] is returned).
+        Returns None when the ring has been closed and every packet has been read.
+        """
+        m = self.map
+        size = self.size
+        tail = self.tail
+        _COUNTER.pack_into(m, _TAIL, tail)
+
+        head = _COUNTER.unpack_from(m, _HEAD)[0]
+        if head == tail:
+            if not self.wait(timeout):
+                return []
+            head = _COUNTER.unpack_from(m, _HEAD)[0]
+            if head == tail:
+                return None
+
+        items = []
+        while tail < head and len(items) < maxitems:
+            pos = tail % size
+            if size - pos < _SLOT.size:
+                tail += size - pos
+                continue
+            off = _HEADER.size + pos
+            ts, ln = _SLOT.unpack_from(m, off)
+            if ln == _WRAP:
+                tail += size - pos
+                continue
+            items.append((ts, buffer(m, off + _SLOT.size, ln)))
+            tail += _SLOT.size + ((ln + 7) & ~7)
+        self.tail = tail
+        return items
+
+    def wait(self, timeout=None):
+        """
+        Waits until the producer writes packets or closes the ring. Returns False if timeout
+        seconds pass without news.
+        """
+        m = self.map
+        _COUNTER.pack_into(m, _WAITING, 1)
+        waited = 0
+        while True:
+            if _COUNTER.unpack_from(m, _HEAD)[0] != self.tail or _COUNTER.unpack_from(m, _CLOSED)[0]:
+                break
+            if timeout is not None and waited >= timeout:
+                _COUNTER.pack_into(m, _WAITING, 0)
+                return False
+            # The producer may have written its head just before we raised the flag
+            self.doorbell.acquire(True, WAIT_TIME)
+            waited += WAIT_TIME
+        _COUNTER.pack_into(m, _WAITING, 0)
+        return True
+
+    def qsize(self):
+        """
+        Bytes used in the ring (its depth, as reported for the queues)
+        """
+        return _COUNTER.unpack_from(self.map, _HEAD)[0] - _COUNTER.unpack_from(self.map, _TAIL)[0]
@@ -0,0 +1,57 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Token bucket: rate limiter that can be shared between threads
+"""
+
+import time
+import threading
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter. Threads take tokens with consume() and are put to sleep when
+    they run out of them.
+
+    +param: rate  - Tokens per second (0 for no limit)
+    +param: burst - Maximum number of tokens that can be accumulated (one second worth of tokens
+                    by default)
+    """
+
+    __slots__ = [ "rate", "burst", "tokens", "stamp", "lock" ]
+
+    def __init__(self, rate=0, burst=None):
+        self.lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """
+        Changes the rate of the bucket
+        """
+        with self.lock:
+            self.rate = float(rate)
+            self.burst = float(burst or max(rate, 1))
+            self.tokens = self.burst
+            self.stamp = time.time()
+
+    def consume(self, n=1):
+        """
+        Takes n tokens from the bucket. If there aren't enough tokens, they are taken in advance
+        and the calling thread sleeps until the bucket has refilled them.
+        """
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
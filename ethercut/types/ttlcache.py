@@ -0,0 +1,57 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+TTLCache: remembers the results of a function for a few seconds
+"""
+
+import time
+import threading
+import functools
+
+
+class TTLCache(object):
+    """
+    Function decorator that caches the results of the decorated function by its arguments for
+    ttl seconds. The cached objects are returned as they are, callers must not modify them.
+
+        @TTLCache(5)
+        def get_gateway():
+            ...
+
+    The decorated function gets a clear() method to drop the cached results (e.g. after
+    changing the interface configuration).
+
+    +param: ttl - Time (in seconds) the results are valid
+    """
+
+    __slots__ = [ "ttl", "cache", "lock" ]
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.time()
+            with self.lock:
+                hit = self.cache.get(args)
+            if hit is not None and now - hit[0] < self.ttl:
+                return hit[1]
+            ret = func(*args)
+            with self.lock:
+                self.cache[args] = (now, ret)
+            return ret
+        wrapper.clear = self.clear
+        return wrapper
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
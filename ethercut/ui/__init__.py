@@ -10,14 +10,15 @@
 User interface package
 """
 
-import Queue
-import sys, termios, time
+import os, sys, termios, time
 import threading
 import contextlib
 
-import sys
-sys.path.insert(0, "/media/ivan/8GB/gitproyects/ethercut")
+import ethercut.metrics as metrics
+import ethercut.types.ticker as ticker
+import ethercut.types.batchqueue as batchqueue
 
+from ethercut.config import ethconf
 from ethercut.context import ctx
 from ethercut.types.colorstr import CStr
 from ethercut.ui.progressbar import ProgressBar
@@ -38,6 +39,9 @@ ERASE = "\033[K"
 # Clear the screen
 CLEAR = "\033[2J\033[H"
 
+# Banner file
+BANNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "share", "banner")
+
 ##########################
 ##  Text user interface ##
 ##########################
@@ -52,8 +56,12 @@ class TextUI(object):
                   "old_tc",
                   # copyright notice and banner
                   "copyright", "banner",
+                  # Render loop, prints the queued messages at a fixed rate
+                  "render", "max_lines", "suppressed",
+                  # Rates of the counters between two statistics displays
+                  "meter",
                   # Thread synchronization
-                  "_fblock", # Event flag to prevent threads to log messages while flushing
+                  "_flock", # Lock held while writing, so the frames are never mixed
                   "_wrblock", # Writing block, when this event flag is cleared, only the thread which
                   "_pidblock" # pid matches _pidblock will be able to log messages, the rest will wait
                   ]
@@ -64,23 +72,36 @@ class TextUI(object):
         self.quiet = quiet
         self.master = master
         self.progressbar =  None
-
-        # Get the banner from the file
-        self.banner = self.get_banner() + self.copyright
-
-        # All the messages will be pushed into the queue, they will
-        # be printed when flush() is called
-        self.queue = Queue.Queue()
+        self.banner = None
+        self.old_tc = None
+
+        # All the messages will be pushed into the queue, they will be printed by the render
+        # loop or when flush() is called
+        self.queue = batchqueue.BatchQueue()
+        self.render = ticker.Ticker(1.0 / ethconf.ui_refresh, self.render_frame, name="UI render")
+        self.max_lines = ethconf.ui_max_lines
+        self.suppressed = 0
+        metrics.registry.gauge("queue.ui", self.queue.qsize)
+        self.meter = metrics.RateMeter(metrics.registry)
 
         # Event to synchronize output when a thread needs to log messages
         # without being mixed with other thread messages
         self._wrblock = threading.Event()
         self._wrblock.set()
         self._pidblock = None
-        # Event to prevent threads to push messages into the queue while flushing
-        self._fblock = threading.Event()
-        self._fblock.set()
+        self._flock = threading.Lock()
+
+        self.setup()
+
+        # Register the User interface in the context
+        ctx.ui = self
 
+    def setup(self):
+        """
+        Prints the banner and prepares the terminal
+        """
+        # Get the banner from the file
+        self.banner = self.get_banner() + self.copyright
         self.instant_msg(CStr(self.banner).grey)
 
         # Disable terminal echoing and buffering
@@ -95,16 +116,12 @@ class TextUI(object):
         new[6][termios.VTIME] = 1
         termios.tcsetattr(fd, termios.TCSANOW, new)
 
-        # Register the User interface in the context
-        ctx.ui = self
-
     def user_msg(self, msg, nl=True):
         """
         Push a message into the queue
         """
         if not self._wrblock.isSet() and self._pidblock != threading.current_thread().ident:
             self._wrblock.wait()
-        self._fblock.wait()
         # Use the EARSE sequence to wipe the previous text
         s = "%s%s" %(ERASE, msg)
         if nl: # Add the newline
@@ -126,17 +143,89 @@ class TextUI(object):
         if not self.quiet:
             self.user_msg(msg, nl)
 
-    def flush(self):
+    def warning(self, msg):
+        """
+        Push a warning message into the queue
+        """
+        self.user_msg("[%s] %s" %(CStr("WARNING").yellow, msg))
+
+    def error(self, msg):
+        """
+        Prints an error message instantly
+        """
+        self.instant_msg("[%s] %s" %(CStr("ERROR").red, msg))
+
+    def section(self, title):
+        """
+        Starts a section of the configuration phase, the previous one is printed
+        """
+        self.msg("")
+        self.flush()
+        self.msg("[ %s ]" %CStr(title).green)
+
+    def flush(self, limit=None):
+        """
+        Print all the queued messages with a single write. Consecutive repeated lines are
+        printed once followed by the number of repetitions. If limit is given, only the first
+        limit lines are printed and the rest are counted as suppressed.
+        """
+        with self._flock:
+            # Only take the messages queued so far, the producers may keep pushing
+            msgs = self.queue.get_batch(self.queue.qsize(), block=False)
+            if not msgs:
+                return
+
+            lines = []
+            last = None
+            count = 0
+            for m in msgs:
+                if m == last and m.endswith("\n"):
+                    count += 1
+                    continue
+                if count > 1:
+                    lines[-1] = "%s (x%d)\n" %(lines[-1][:-1], count)
+                lines.append(m)
+                last = m
+                count = 1
+            if count > 1:
+                lines[-1] = "%s (x%d)\n" %(lines[-1][:-1], count)
+
+            if limit is not None and len(lines) > limit:
+                dropped = len(lines) - limit
+                self.suppressed += dropped
+                lines = lines[:limit]
+                lines.append("%s[%s] %d messages suppressed\n" %(ERASE, CStr("UI").yellow, dropped))
+
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+
+    def render_frame(self):
+        """
+        Render loop activity, prints the messages queued since the last frame
+        """
+        self.flush(self.max_lines)
+
+    def forward(self, sink):
         """
-        Print all the queued messages
+        Used in the worker processes of the koala filter: the queued messages are sent to sink
+        (a multiprocessing queue) at the refresh rate and the main process prints them.
         """
-        # XXX - We need to prevent other threads to log messages while flushing
-        # the current queue
-        self._fblock.clear()
-        while not self.queue.empty():
-            msg = self.queue.get()
-            sys.stdout.write(msg)
-        self._fblock.set()
+        # A thread of the parent may have been holding them when the process was forked
+        self.queue = batchqueue.BatchQueue()
+        self._flock = threading.Lock()
+        self._wrblock = threading.Event()
+        self._wrblock.set()
+        self._pidblock = None
+        self.render = ticker.Ticker(1.0 / ethconf.ui_refresh, self.forward_frame, "UI forward", sink)
+        self.render.start()
+
+    def forward_frame(self, sink):
+        """
+        Sends the messages queued since the last frame to sink
+        """
+        msgs = self.queue.get_batch(self.queue.qsize(), block=False)
+        if msgs:
+            sink.put(msgs)
 
     def clear(self):
         """
@@ -169,58 +258,18 @@ class TextUI(object):
         Returns the banner as a string
         """
         s = ""
-        with open("/media/ivan/8GB/gitproyects/ethercut/share/banner", "r") as f:
-        #with open("/Volumes/8GB/gitproyects/ethercut/share/banner", "r") as f:
+        with open(os.path.normpath(BANNER), "r") as f:
             for l in f:
                 s+="%s"%l
         s = s.replace("%VERSION%", "v"+VERSION+" "+STATE)
         return s
 
     def start(self):
-        self.user_msg("Welcome to ethercut, have fun and don't be evil!\n")
+        self.user_msg("Welcome to ethercut, have fun and don't be evil!")
 
         ########  Ethercut configuration phase  ########
 
-        self.msg("[ %s ]"%CStr("Modules loaded").green)
-
-        loaded = ", ".join(CStr(x.name).yellow for x in self.master.spoofers)
-        self.msg("Loaded %s spoofer%s [%s]" %(len(self.master.spoofers),
-                                                    "" if len(self.master.spoofers) == 1 else "s",
-                                                    loaded))
-        loaded = ", ".join(CStr(x.name).yellow for x in self.master.decoders)
-        self.msg("Loaded %s decoder%s [%s]" %(len(self.master.decoders),
-                                                    "" if len(self.master.decoders) == 1 else "s",
-                                                    loaded))
-        self.msg("")
-        self.flush()
-
-        self.msg("[ %s ]"%CStr("Network parameters").green)
-        if not self.master.opt.sniff.read:
-            self.master.update_network()
-            self.master.injector.configure()
-        else:
-            self.msg("No network parameters needed while reading form a file")
-
-        self.msg("")
-        self.flush()
-
-        self.msg("[ %s ]"%CStr("TARGETs compiled").green)
-        self.master.update_targets()
-        self.msg("")
-        self.flush()
-
-        self.msg("[ %s ]"%CStr("Sniffer").green)
-        self.master.sniffer.configure()
-        self.msg("")
-        self.flush()
-
-        self.msg("[ %s ]" %CStr("Koala filter").green)
-        self.master.filter.configure()
-        self.msg("")
-        self.flush()
-
-        self.msg("[ %s ]" %CStr("Target discovery manager").green)
-        self.master.discovery.configure()
+        self.master.configure()
         self.msg("")
         self.flush()
 
@@ -237,11 +286,8 @@ class TextUI(object):
         print "NOW!"
         self.clear()
         self.instant_msg(CStr(self.banner).grey)
-        self.master.injector.start()
-        self.master.discovery.start()
-        self.master.sniffer.start()
-        self.master.filter.start()
-        self.master.spoofers.start_all()
+        self.render.start()
+        self.master.launch()
 
         ######## End of startup ########
 
@@ -254,6 +300,9 @@ class TextUI(object):
             if inp == "h":
                 self.help()
 
+            if inp == "s":
+                self.stats()
+
             if inp == "q":
                 print "Shutting down..."
                 break
@@ -269,6 +318,20 @@ class TextUI(object):
             self.user_msg("\t[ %s ]" %CStr("Help").blue)
             self.user_msg(" [q] Exit the program")
             self.user_msg(" [h] Shows this help screen")
+            self.user_msg(" [s] Shows the statistics")
+            self.user_msg("")
+            self.flush()
+
+    def stats(self):
+        """
+        Displays the metrics of every stage
+        """
+        with self.block():
+            self.user_msg("")
+            self.user_msg("\t[ %s ]" %CStr("Statistics").blue)
+            self.user_msg(" %s" %self.master.filter.stats)
+            for line in metrics.registry.report(self.meter):
+                self.user_msg(" %s" %line)
             self.user_msg("")
             self.flush()
 
@@ -307,12 +370,13 @@ class TextUI(object):
         """
         # If a CTRL-C was requested, a thread may be waiting some flag to be set
         self._wrblock.set()
-        self._fblock.set()
+        self.render.end()
 
         # Flush all pending messages
         self.flush()
         print ""
 
         # Restore previous terminal settings
-        fd = sys.stdin.fileno()
-        termios.tcsetattr(fd, termios.TCSANOW, self.old_tc)
+        if self.old_tc is not None:
+            fd = sys.stdin.fileno()
+            termios.tcsetattr(fd, termios.TCSANOW, self.old_tc)
@@ -0,0 +1,105 @@
+# coding: utf-8
+
+# ETHERCUT SUITE
+# Author: Ivan 'evilgroot' Luengo
+# Email: evilgroot@gmail.com
+
+# This project is released under a GPLv3 license
+
+"""
+Headless user interface: structured log lines for unattended runs
+"""
+
+import re, sys, time, json
+import threading
+import contextlib
+
+import ethercut.ui as ui
+import ethercut.types.colorstr as colorstr
+
+from ethercut import PROGRAM
+from ethercut.ui.progressbar import ProgressBar
+
+# ANSI escape sequences (colors and cursor movements)
+ANSI = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+
+
+class HeadlessUI(ui.TextUI):
+    """
+    User interface for unattended runs (e.g. under a supervisor). It doesn't need a terminal,
+    every message is written to stdout as a JSON object per line with the time, the level and
+    the text without colors. There is no banner, countdown nor keyboard input, the program
+    runs until it gets SIGINT or SIGTERM.
+    """
+
+    __slots__ = []
+
+    def setup(self):
+        colorstr.COLORS_ON = False
+        self.render.start()
+
+    def log(self, level, msg):
+        """
+        Push a structured message into the queue
+        """
+        text = ANSI.sub("", str(msg)).strip()
+        if not text:
+            return
+        self.queue.put(json.dumps({ "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                    "level": level, "msg": text }) + "\n")
+
+    def user_msg(self, msg, nl=True):
+        if not self._wrblock.isSet() and self._pidblock != threading.current_thread().ident:
+            self._wrblock.wait()
+        self.log("info", msg)
+
+    def warning(self, msg):
+        self.log("warning", msg)
+
+    def error(self, msg):
+        self.log("error", msg)
+        self.flush()
+
+    def section(self, title):
+        self.log("info", "Configuring: %s" %title)
+
+    def flush(self, limit=None):
+        """
+        Writes every queued line, they are never collapsed nor suppressed
+        """
+        with self._flock:
+            msgs = self.queue.get_batch(self.queue.qsize(), block=False)
+            if msgs:
+                sys.stdout.write("".join(msgs))
+                sys.stdout.flush()
+
+    def clear(self):
+        self.flush()
+
+    def clean_exit(self):
+        """
+        Stops the render loop and writes the pending lines, stdout only gets JSON lines
+        """
+        self._wrblock.set()
+        self.render.end()
+        self.flush()
+
+    def start(self):
+        self.log("info", "Starting %s" %PROGRAM)
+        self.master.configure()
+        self.master.launch()
+        self.log("info", "Running")
+        while True:
+            time.sleep(60)
+
+    @contextlib.contextmanager
+    def progress(self, pmax, task="Progress"):
+        """
+        Progress of a task, only its start is logged
+        """
+        self.log("info", task)
+        progressbar = ProgressBar(pmax, lambda bar: None, task)
+        try:
+            yield progressbar
+        finally:
+            progressbar.done.set()
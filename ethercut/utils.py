@@ -12,9 +12,13 @@ Miscellaneous utility functions
 
 import socket
 import re, struct
+import array, bisect, threading
 import ethercut.shell as shell
 import ethercut.const as const
+import ethercut.platform as platform
 import ethercut.exceptions as exceptions
+import ethercut.types.rangeset as rangeset
+import ethercut.types.ttlcache as ttlcache
 
 
 ##########################
@@ -65,33 +69,84 @@ def normalize(x):
 ##  Vendor lookup  ##
 #####################
 
+VENDOR_LIST = "/usr/share/ethercut/vendor-list"
+
+# OUI index: sorted array of 24 bit OUIs and the (short, long) vendor names at the same positions
+_oui_index = None
+_oui_names = None
+_oui_lock = threading.Lock()
+# Already resolved prefixes (xx:xx:xx) -> (short, long)
+_vendor_cache = {}
+
+def _load_vendors():
+    """
+    Loads the vendor-list file into the OUI index. Only the first entry of each OUI is kept.
+    Returns False if the file can't be read.
+    """
+    global _oui_index, _oui_names
+    entries = {}
+    loaded = True
+    try:
+        with open(VENDOR_LIST) as f:
+            for l in f:
+                l = l.strip()
+                if not l or l.startswith("#"):
+                    continue
+                fields = l.split()
+                if len(fields) < 2:
+                    continue
+                try:
+                    oui = int(fields[0][:8].replace(":", "").replace("-", ""), 16)
+                except ValueError:
+                    continue
+                if oui in entries:
+                    continue
+                shrt = fields[1]
+                i = l.find("#")
+                entries[oui] = (shrt, shrt if i < 0 else l[i+2:])
+    except IOError:
+        entries = {}
+        loaded = False
+    ouis = sorted(entries)
+    # vendor_lookup() checks _oui_index without the lock, so the names must be in place
+    # before the index is published
+    _oui_names = [entries[o] for o in ouis]
+    _oui_index = array.array("I", ouis)
+    return loaded
+
 def vendor_lookup(mac):
     """
-    Looks up in the vendor-list file for the manufacturer
+    Looks up the manufacturer of a MAC address in the vendor-list file, the file is only read
+    the first time this function is called.
+    Returns a tuple (short name, long name), or (None, None) if the vendor-list is not available
     """
-    if mac:
-        try:
-            with open("/usr/share/ethercut/vendor-list") as f:
-                for l in f:
-                    l = l.strip()
-                    if not l or l.startswith("#"):
-                        continue
-                    if not l.startswith(mac.upper()[:8]):
-                        continue
-                    oui, shrt = l.split()[:2]
-                    i = l.find("#")
-                    if i < 0:
-                        lng = shrt
-                    else:
-                        lng = l[i+2:]
-                    ret = shrt, lng
-                    break
-                else:
-                    ret = "Unknown", "Unknown"
-            return ret
-        except IOError as err:
-            pass
-    return None, None
+    if not mac:
+        return None, None
+
+    prefix = mac.upper()[:8]
+    try:
+        return _vendor_cache[prefix]
+    except KeyError:
+        pass
+
+    if _oui_index is None:
+        with _oui_lock:
+            if _oui_index is None:
+                _load_vendors()
+    if not _oui_names:
+        return None, None
+
+    try:
+        oui = int(prefix.replace(":", ""), 16)
+    except ValueError:
+        return "Unknown", "Unknown"
+    i = bisect.bisect_left(_oui_index, oui)
+    if i < len(_oui_index) and _oui_index[i] == oui:
+        ret = _oui_names[i]
+    else:
+        ret = "Unknown", "Unknown"
+    _vendor_cache[prefix] = ret
+    return ret
 
 ###########################
 ##  Address conversions  ##
@@ -112,6 +167,26 @@ def ntoa(x):
     """
     return socket.inet_ntop(socket.AF_INET, struct.pack(">I", x))
 
+def mton(x):
+    """
+    Converts a MAC address (xx:xx:xx:xx:xx:xx) to its 6 bytes binary form
+    """
+    # is_mac() only checks the beginning of x
+    if is_mac(x):
+        octets = x.split(":")
+        if len(octets) == 6:
+            try:
+                return struct.pack("6B", *[int(b, 16) for b in octets])
+            except ValueError:
+                pass
+    raise ValueError("x must be a valid MAC address: %s" %x)
+
+def ntom(x):
+    """
+    Converts a 6 bytes binary MAC address to its normalized form (xx:xx:xx:xx:xx:xx)
+    """
+    return "%02x:%02x:%02x:%02x:%02x:%02x" %struct.unpack("6B", x)
+
 #########################
 ##  Address expansion  ##
 #########################
@@ -127,9 +202,7 @@ def expand_mac(mac):
         macs = mac.split(",")
         for m in macs:
             try:
-                if not is_mac(m):
-                    raise ValueError()
-                ret.append(m)
+                ret.append(normalize(m))
             except ValueError:
                 raise exceptions.EthercutException("Invalid mac address \"%s\"" %m)
 
@@ -194,12 +267,12 @@ def expand_ip(ip):
 
 def expand_port(port):
     """
-    Returns a list of ports by expanding the parameter port
+    Returns a PortSet by expanding the parameter port
     """
     if not port: # "" means all ports
         ret = None
     else:
-        ret = []
+        ret = rangeset.PortSet()
         ports = port.split(",") # Split individual ports
         for p in ports:
             try:
@@ -207,29 +280,29 @@ def expand_port(port):
                     first, last = map(int, p.split("-"))
                     if last < first: # Bad range, first must be smaller
                         raise ValueError()
-
-                    for i in xrange(first, last+1):
-                        if i < 0 or i > 65535: # Port out of range
-                            raise exceptions.EthercutException("Port out of range (0-65535) \"%s\"" %p)
-                        ret.append(i)
+                    if first < 0 or last > 65535: # Port out of range
+                        raise exceptions.EthercutException("Port out of range (0-65535) \"%s\"" %p)
+                    ret.add_range(first, last)
                 else:
                     intp = int(p)
                     if intp < 0 or intp > 65535: # Port out of range
                         raise exceptions.EthercutException("Port out of range (0-65535) \"%s\"" %p)
-                    ret.append(intp)
+                    ret.add(intp)
 
             except ValueError:
                 raise exceptions.EthercutException("Invalid port/range \"%s\"" %p)
 
-
-        # Remove repeated ports
-        ret = list(set(ret))
     return ret
 
 #######################
 ##  Address parsing  ##
 #######################
 
+# Time (in seconds) the interface, route and neighbour details are cached
+IFACE_TTL = 5
+ARP_TTL   = 2
+
+@ttlcache.TTLCache(ARP_TTL)
 def arp_read(addr):
     """
     Reads the arp cache for a concrete address mac or ip address and returns the other one(*).
@@ -237,6 +310,24 @@ def arp_read(addr):
 
     (*)if addr is IP -> returns its MAC/ if addr is MAC -> returns its IP.
     """
+    if not is_ip(addr) and not is_mac(addr):
+        raise ValueError("addr must be either a valid IP or MAC address")
+
+    native = getattr(platform, "arp_cache", None)
+    if native is not None:
+        try:
+            cache = native()
+        except IOError:
+            pass # Fall back to arp
+        else:
+            if is_ip(addr):
+                return cache.get(addr)
+            addr = addr.lower()
+            for ip, mac in cache.iteritems():
+                if mac.lower() == addr:
+                    return ip
+            return None
+
     cache = shell.Shell().arp("-na")[0]
     cache = cache.split("\n")
     for l in cache:
@@ -245,14 +336,35 @@ def arp_read(addr):
                 return l.split()[3]
             if is_mac(addr):
                 return l.split()[1][1:-1] # Skip parentheses
-            else:
-                raise ValueError("addr must be either a valid IP or MAC address")
     return None
 
+@ttlcache.TTLCache(IFACE_TTL)
+def get_gateway():
+    """
+    Returns the IP address of the default gateway, None if not found
+    """
+    native = getattr(platform, "get_gateway", None)
+    if native is not None:
+        try:
+            return native()
+        except IOError:
+            pass # Fall back to netstat
+
+    # Execute netstat to get the routing table
+    netst = shell.Shell().netstat("-nr")[0]
+    netst = netst[2:].split("\n")
+    for l in netst:
+        # Look for a valid Route "U", and a gateway "G"
+        if "UG" in l:
+            return l.split()[1]
+    return None
+
+@ttlcache.TTLCache(IFACE_TTL)
 def get_iface(iface):
     """
-    Returns a dictionary containing relevant information about a given intreface parsing the
-    output of ifconfig.
+    Returns a dictionary containing relevant information about a given intreface. The details
+    are read natively when the platform supports it, otherwise the output of ifconfig is
+    parsed.
     Information will be stored as a dictionary as follows:
         {"iface": {"hw": "00:00:00:00:00:00", "inet": "192.168.2.37", ...}}
             hw: hardware address
@@ -264,6 +376,12 @@ def get_iface(iface):
 
     NOTE: Currently only handles Linux ifconfig output
     """
+    native = getattr(platform, "get_iface", None)
+    if native is not None:
+        try:
+            return native(iface)
+        except IOError:
+            pass # Fall back to ifconfig
 
     # Run ifconfig
     ifcnf = shell.Shell().ifconfig(iface)